@@ -1,6 +1,18 @@
 from scipy import signal as scisig
 import scipy.fftpack as scifft
+from scipy.spatial import cKDTree
+from scipy.special import digamma, xlogy
+from scipy.stats import kstwo, ks_2samp
 import os
+import functools
+import gzip
+import hashlib
+import io
+import json
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from fractions import Fraction
 from itertools import chain
 import numpy as np
 import xml.etree.ElementTree as ET
@@ -8,67 +20,75 @@ import math
 import pandas as pd
 
 # ARTIFACTS REMOVAL
-def remove_current_pulse_artifacts(sig, markers, window, n_draws, return_artifacts=False):
-    """Remove current pulse artifacts from one-dimensional signal based on artifacts occurences represented
+def remove_current_pulse_artifacts(sig, markers, window, n_draws, return_artifacts=False, rng=None,
+                                   template='random'):
+    """Remove current pulse artifacts from one- or two-dimensional signal based on artifacts occurences represented
     by one-dimensional markers signal. Current pulse artifacts removal is performed in following steps:
     1. Extract current pulse artifacts from 'sig' based on 'markers' which contains ones and zeros, whereas ones
     indicate current pulse artifact occurences.
     2. Extraction is performed around the artifact occurence in accordance to range described by 'window'.
-    3. Extracted artifacts are stored in two-dimensional numpy.ndarray.
+    3. Extracted artifacts are stored in numpy.ndarray of shape (n_artifacts, window_size) or
+    (n_channels, n_artifacts, window_size).
     4. We draw from stored artifacts 'n_draws' without repetition and average them in order to get averaged
     representation of current pulse artifact.
     5. We substract this averaged artifact representation from the first occurence of the artifact in 'sig'.
     6. We now repeat steps 4 and 5 for all next subsequent artifact occurences in 'sig'.
+    With 'sliding' template, step 4 instead averages 'n_draws' most recent artifacts (up to and including the current
+    one), which follows slow changes of the artifact shape, e.g. due to electrode impedance drift.
+
+    All artifacts are gathered at once with a strided view on 'sig' and the averaged representations for all
+    occurences (and all channels) are computed with batched indexed means, so the cost does not depend on a Python
+    loop over samples.
 
     Parameters
     ----------
-    sig : 1D numpy.ndarray
-        One-dimensional signal with the occurences of current pulse artifacts.
-    markers : 1D numpy.ndarray
+    sig : 1D or 2D numpy.ndarray
+        One-dimensional signal or two-dimensional (channels x samples) signal with the occurences of current pulse
+        artifacts. Signal is cleared in place.
+    markers : 1D numpy.ndarray | Events
         One-dimensional signal consisted of ones and zeros, where ones correspond to the exact sample occurences
-        of current pulse artifact in 'sig'. That's why 'markers'.size' must equal to 'sig.size'.
+        of current pulse artifact in 'sig'. That's why 'markers'.size' must equal to the number of samples in 'sig'.
+        Alternatively, Events with unique indices and 'n_samples' equal to the number of samples in 'sig'.
     window : list of int of length 2
         List consisted of two values describing sample range (window) of the current pulse artifact around
-        its occurence.
+        its occurence, ie. artifact occuring at sample i spans samples from i - window[0] to i + window[1].
     n_draws : int
         Number of draws from the collection of stored artifacts. Must be >= 1.
     return_artifacts : boolean
         If True, beside of cleared signal, function will return also collection of the stored artifacts. Default value
         is False.
+    rng : None | int | numpy.random.Generator
+        Random generator (or seed for numpy.random.default_rng) used for drawing the artifacts. Pass seeded generator
+        to make the removal reproducible. Default value is None.
+    template : str
+        Strategy of creating averaged artifact representation. Available options: 'random', 'sliding'. Default value
+        is 'random'.
 
     Returns
     -------
-    cleared : 1D numpy.ndarray
+    cleared : 1D or 2D numpy.ndarray
         Cleared signal.
-    artifacts : 2D numpy.ndarray
+    artifacts : 2D or 3D numpy.ndarray
         Collection of the stored artifacts.
     """
-    if (isinstance(sig, np.ndarray) and sig.ndim == 1 and isinstance(markers, np.ndarray) and markers.ndim == 1
-            and ndarray_contains_only(markers, np.array([0, 1])) and sig.size == markers.size and len(window) in range(
-                1, 3)
-            and list_is_int(window) and isinstance(n_draws, int) and n_draws >= 1):
+    if (isinstance(sig, np.ndarray) and sig.ndim in [1, 2] and markers_are_valid(markers, sig.shape[-1])
+            and isinstance(window, list) and len(window) == 2 and list_is_int(window) and isinstance(n_draws, int)
+            and n_draws >= 1 and template in ['random', 'sliding']):
+
+        rng = np.random.default_rng(rng)
+        window_size = window[0] + window[1]
 
         # Extract artifacts.
-        artifacts = []
-        iterator = 0
-        for marker in markers:
-            if marker == 1:
-                artifacts.append(sig[iterator - window[0]:iterator + window[1]])
-            iterator += 1
-        artifacts = np.asarray(artifacts)
+        starts = marker_indices(markers) - window[0]
+        artifacts = extract_epochs(sig, starts, window_size)
 
         # Remove artifacts from the signal.
-        iterator = 0
-        for marker in markers:
-            if marker == 1:
-
-                if n_draws > np.shape(artifacts)[0]:
-                    n_draws = np.shape(artifacts)[0]
-
-                random_artifact_indices = np.random.choice(np.arange(np.shape(artifacts)[0]), n_draws, replace=False)
-                avg_artifact = np.mean(np.take(artifacts, random_artifact_indices, axis=0), axis=0)
-                sig[iterator - window[0]:iterator + window[1]] -= avg_artifact
-            iterator += 1
+        if starts.size > 0:
+            if template == 'random':
+                avg_artifacts = average_random_artifacts(artifacts, starts.size, n_draws, rng)
+            else:
+                avg_artifacts = average_recent_artifacts(artifacts, n_draws)
+            subtract_epochs(sig, starts, avg_artifacts)
         cleared = sig
 
         # Return cleared signal and extracted artifacts.
@@ -81,11 +101,456 @@ def remove_current_pulse_artifacts(sig, markers, window, n_draws, return_artifac
             "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
 
 
+def iter_remove_current_pulse_artifacts(sig, markers, window, n_draws, block_size, bank_size=100, rng=None,
+                                        template='random'):
+    """Remove current pulse artifacts block by block from a signal which does not have to fit into memory, e.g.
+    numpy.memmap of a long recording. Signal is read in blocks of 'block_size' samples, each one extended by the
+    size of the artifact 'window', so that artifacts crossing the block boundary are handled. Averaged artifact
+    representation for every occurence is made of 'n_draws' artifacts drawn without repetition from the rolling bank
+    of the 'bank_size' most recent artifacts (up to and including the current one). Thus, peak memory depends on
+    'block_size' and 'bank_size' only, not on the length of the recording. 'sig' itself is never modified.
+    With 'sliding' template, averaged artifact representation is the running average of the 'n_draws' most recent
+    artifacts instead (see SlidingArtifactTemplate) and 'bank_size' is not used.
+
+    Example of writing cleared signal straight back to disk:
+    > sig = np.load('recording.npy', mmap_mode='r')
+    > cleared = np.lib.format.open_memmap('cleared.npy', mode='w+', dtype=float, shape=sig.shape)
+    > for start, block in iter_remove_current_pulse_artifacts(sig, markers, [10, 90], 50, 2 ** 20):
+    >     cleared[..., start:start + block.shape[-1]] = block
+
+    Parameters
+    ----------
+    sig : 1D or 2D numpy.ndarray | numpy.memmap | str
+        One-dimensional signal or two-dimensional (channels x samples) signal with the occurences of current pulse
+        artifacts. If str, path to the .npy file which will be memory-mapped.
+    markers : 1D numpy.ndarray | numpy.memmap | Events | str
+        One-dimensional signal consisted of ones and zeros, where ones correspond to the exact sample occurences
+        of current pulse artifact in 'sig', or Events with unique indices. If str, path to the .npy file which will be
+        memory-mapped.
+    window : list of int of length 2
+        List consisted of two values describing sample range (window) of the current pulse artifact around
+        its occurence, ie. artifact occuring at sample i spans samples from i - window[0] to i + window[1].
+    n_draws : int
+        Number of draws from the bank of recent artifacts. Must be >= 1.
+    block_size : int
+        Number of samples in each of the yielded blocks. Must be >= 1.
+    bank_size : int
+        Number of the most recent artifacts kept in the bank. Must be >= 1. Default value is 100.
+    rng : None | int | numpy.random.Generator
+        Random generator (or seed for numpy.random.default_rng) used for drawing the artifacts. Default value is None.
+    template : str
+        Strategy of creating averaged artifact representation. Available options: 'random', 'sliding'. Default value
+        is 'random'.
+
+    Yields
+    ------
+    start : int
+        Index of the first sample of the block.
+    block : 1D or 2D numpy.ndarray
+        Cleared block of the signal.
+    """
+    if isinstance(sig, str):
+        sig = np.load(sig, mmap_mode='r')
+    if isinstance(markers, str):
+        markers = np.load(markers, mmap_mode='r')
+
+    if (isinstance(sig, np.ndarray) and sig.ndim in [1, 2]
+            and (isinstance(markers, Events) and markers_are_valid(markers, sig.shape[-1])
+                 or isinstance(markers, np.ndarray) and markers.ndim == 1 and sig.shape[-1] == markers.size)
+            and isinstance(window, list) and len(window) == 2
+            and list_is_int(window) and isinstance(n_draws, int) and n_draws >= 1 and isinstance(block_size, int)
+            and block_size >= 1 and isinstance(bank_size, int) and bank_size >= 1
+            and template in ['random', 'sliding']):
+        return _iter_cleared_blocks(sig, markers, window, n_draws, block_size, bank_size, np.random.default_rng(rng),
+                                    template)
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+
+
+def _iter_cleared_blocks(sig, markers, window, n_draws, block_size, bank_size, rng, template):
+    n_samples = sig.shape[-1]
+    window_size = window[0] + window[1]
+
+    # Rolling bank of the most recent artifacts.
+    if template == 'random':
+        bank = np.empty((bank_size,) + sig.shape[:-1] + (window_size,))
+        n_banked = 0
+    else:
+        sliding = SlidingArtifactTemplate(n_draws, sig.shape[:-1] + (window_size,))
+
+    # Averaged artifacts which may still overlap with the next blocks.
+    active_starts = []
+    active_artifacts = []
+
+    scanned = 0
+    for block_start in range(0, n_samples, block_size):
+        block_stop = min(block_start + block_size, n_samples)
+
+        # Read the block together with the overlap needed by artifacts starting inside of it.
+        buffer = np.array(sig[..., block_start:min(n_samples, block_stop + window_size)], dtype=float)
+
+        # Find new artifacts, ie. those which start before the end of the block.
+        scan_stop = min(n_samples, block_stop + window[0])
+        if isinstance(markers, Events):
+            onsets = markers.between(scanned, scan_stop)
+        else:
+            onsets = scanned + np.flatnonzero(np.asarray(markers[scanned:scan_stop]))
+        scanned = scan_stop
+
+        for onset in onsets:
+            start = onset - window[0]
+            if start < 0 or start + window_size > n_samples:
+                raise ValueError("Artifact window around sample {} exceeds the signal.".format(onset))
+            artifact = buffer[..., start - block_start:start - block_start + window_size]
+            if template == 'random':
+                bank[n_banked % bank_size] = artifact
+                n_banked += 1
+                n_filled = min(n_banked, bank_size)
+                draws = rng.choice(n_filled, min(n_draws, n_filled), replace=False)
+                avg_artifact = bank[draws].mean(axis=0)
+            else:
+                avg_artifact = sliding.update(artifact)
+            active_starts.append(start)
+            active_artifacts.append(avg_artifact)
+
+        # Remove artifacts from the block.
+        block = buffer[..., :block_stop - block_start]
+        for start, avg_artifact in zip(active_starts, active_artifacts):
+            lo = max(start, block_start)
+            hi = min(start + window_size, block_stop)
+            if lo < hi:
+                block[..., lo - block_start:hi - block_start] -= avg_artifact[..., lo - start:hi - start]
+
+        # Forget artifacts which end within the block.
+        keep = [i for i, start in enumerate(active_starts) if start + window_size > block_stop]
+        active_starts = [active_starts[i] for i in keep]
+        active_artifacts = [active_artifacts[i] for i in keep]
+
+        yield block_start, block.copy()
+
+
+def extract_epochs(sig, starts, size):
+    """Extract equally sized epochs from the last axis of the signal with a single strided gather.
+
+    Parameters
+    ----------
+    sig : numpy.ndarray
+        Signal with samples along the last axis, e.g. (samples) or (channels x samples).
+    starts : 1D numpy.ndarray of int
+        Sorted first samples of the epochs.
+    size : int
+        Number of samples in each epoch. Must be >= 1.
+
+    Returns
+    -------
+    epochs : numpy.ndarray
+        Copy of the epochs of shape (..., starts.size, size).
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    if (isinstance(sig, np.ndarray) and starts.ndim == 1 and size >= 1 and sig.shape[-1] >= size
+            and (starts.size == 0 or (starts.min() >= 0 and starts.max() + size <= sig.shape[-1]))):
+        return np.lib.stride_tricks.sliding_window_view(sig, size, axis=-1)[..., starts, :]
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Epochs must lie within the signal.")
+
+
+def average_random_artifacts(artifacts, n_averages, n_draws, rng=None, max_elements=2 ** 24):
+    """Create averaged representations of the artifact, each one being the mean of 'n_draws' artifacts drawn without
+    repetition from the collection of stored artifacts. Draws for all representations are made at once and averaged
+    with a batched indexed mean, processed in chunks of at most 'max_elements' gathered samples.
+
+    Parameters
+    ----------
+    artifacts : numpy.ndarray
+        Collection of the stored artifacts of shape (..., n_artifacts, window_size).
+    n_averages : int
+        Number of averaged representations to create.
+    n_draws : int
+        Number of draws for each averaged representation. If higher than the number of artifacts, all artifacts
+        are averaged.
+    rng : None | int | numpy.random.Generator
+        Random generator (or its seed). Default value is None.
+    max_elements : int
+        Upper bound of the number of samples gathered at once. Default value is 2 ** 24.
+
+    Returns
+    -------
+    avg_artifacts : numpy.ndarray
+        Averaged artifacts of shape (..., n_averages, window_size).
+    """
+    rng = np.random.default_rng(rng)
+    n_artifacts = artifacts.shape[-2]
+    n_draws = min(n_draws, n_artifacts)
+    out_shape = artifacts.shape[:-2] + (n_averages, artifacts.shape[-1])
+
+    # Drawing all of the artifacts gives the same average every time.
+    if n_draws == n_artifacts:
+        return np.broadcast_to(artifacts.mean(axis=-2, keepdims=True), out_shape).copy()
+
+    avg_artifacts = np.empty(out_shape, dtype=np.result_type(artifacts.dtype, 1.0))
+    chunk = max(1, max_elements // max(n_draws * artifacts[..., 0, :].size, n_artifacts))
+    for start in range(0, n_averages, chunk):
+        stop = min(start + chunk, n_averages)
+        # Drawing without repetition: indices of the 'n_draws' smallest random keys in each row.
+        keys = rng.random((stop - start, n_artifacts))
+        draws = np.argpartition(keys, n_draws - 1, axis=1)[:, :n_draws]
+        avg_artifacts[..., start:stop, :] = np.take(artifacts, draws, axis=-2).mean(axis=-2)
+    return avg_artifacts
+
+
+def average_recent_artifacts(artifacts, n_recent):
+    """Create averaged representations of the artifact, one for every stored artifact, each one being the mean of the
+    'n_recent' most recent artifacts up to and including it. Averages are computed from cumulative sums along the
+    artifacts axis, ie. in O(window_size) per artifact.
+
+    Parameters
+    ----------
+    artifacts : numpy.ndarray
+        Collection of the stored artifacts of shape (..., n_artifacts, window_size) in order of occurence.
+    n_recent : int
+        Number of the most recent artifacts in each average. Must be >= 1.
+
+    Returns
+    -------
+    avg_artifacts : numpy.ndarray
+        Averaged artifacts of shape (..., n_artifacts, window_size).
+    """
+    n_artifacts = artifacts.shape[-2]
+    cumsum = np.cumsum(artifacts, axis=-2, dtype=np.result_type(artifacts.dtype, 1.0))
+    sums = cumsum.copy()
+    if n_recent < n_artifacts:
+        sums[..., n_recent:, :] -= cumsum[..., :n_artifacts - n_recent, :]
+    counts = np.minimum(np.arange(1, n_artifacts + 1), n_recent)
+    return sums / counts[:, np.newaxis]
+
+
+class SlidingArtifactTemplate:
+    """Running average of the 'n_artifacts' most recent artifacts kept in a ring buffer. Each update costs
+    O(window_size): the oldest artifact is subtracted from the running sum and the newest one is added. The sum is
+    recomputed from the ring buffer once per its full cycle, so rounding errors do not accumulate.
+
+    Parameters
+    ----------
+    n_artifacts : int
+        Number of the most recent artifacts in the average. Must be >= 1.
+    shape : int | tuple of int
+        Shape of a single artifact, e.g. window_size or (n_channels, window_size).
+    """
+
+    def __init__(self, n_artifacts, shape):
+        if isinstance(n_artifacts, int) and n_artifacts >= 1:
+            self.n_artifacts = n_artifacts
+            self._ring = np.zeros((n_artifacts,) + tuple(np.atleast_1d(shape)))
+            self._sum = np.zeros(self._ring.shape[1:])
+            self._position = 0
+            self._count = 0
+        else:
+            raise ValueError("Inappropriate type or value of 'n_artifacts'. It should be int >= 1.")
+
+    def update(self, artifact):
+        """Add new artifact to the running average.
+
+        Parameters
+        ----------
+        artifact : numpy.ndarray
+            Artifact of the shape given at construction.
+
+        Returns
+        -------
+        template : numpy.ndarray
+            Average of the most recent artifacts including 'artifact'.
+        """
+        self._sum -= self._ring[self._position]
+        self._ring[self._position] = artifact
+        self._sum += self._ring[self._position]
+        self._position = (self._position + 1) % self.n_artifacts
+        self._count = min(self._count + 1, self.n_artifacts)
+        if self._position == 0:
+            self._sum = self._ring.sum(axis=0)
+        return self.template
+
+    @property
+    def template(self):
+        """Current average of the most recent artifacts (zeros before the first update)."""
+        return self._sum / max(self._count, 1)
+
+
+def subtract_epochs(sig, starts, epochs):
+    """Subtract epochs from the last axis of the signal in place. Overlapping epochs are accumulated.
+
+    Parameters
+    ----------
+    sig : numpy.ndarray
+        Signal with samples along the last axis.
+    starts : 1D numpy.ndarray of int
+        Sorted first samples of the epochs.
+    epochs : numpy.ndarray
+        Epochs of shape (..., starts.size, epoch_size) broadcastable with the leading axes of 'sig'.
+
+    Returns
+    -------
+    sig : numpy.ndarray
+        Signal after subtraction.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    indices = starts[:, np.newaxis] + np.arange(epochs.shape[-1])
+    if np.all(np.diff(starts) >= epochs.shape[-1]):
+        sig[..., indices] -= epochs
+    else:
+        np.subtract.at(sig, (Ellipsis, indices), epochs)
+    return sig
+
+
 # EXPLORATION AND MARKING
-def mark_photodiode_changes(sig, threshold, wait_n_samples, direction='left-to-right'):
+class Events:
+    """Sparse representation of events (e.g. markers) occuring in a signal: sorted sample indices of the events,
+    optional integer codes of the events and the number of samples in the signal. For a few hundred events in a long
+    recording it takes a fraction of the memory of the equivalent dense array of zeros and ones.
+
+    Parameters
+    ----------
+    indices : 1D array-like of int
+        Sample indices of the events. They are sorted (stably) and stored as int64. Must lie in range
+        [0, n_samples - 1].
+    n_samples : int
+        Number of samples in the signal. Must be >= 0.
+    codes : 1D array-like of int | None
+        Codes of the events, one per index. If None, all events have code 1. Default value is None.
+    """
+
+    __slots__ = ('indices', 'codes', 'n_samples')
+
+    def __init__(self, indices, n_samples, codes=None):
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        order = np.argsort(indices, kind='stable')
+        if codes is not None:
+            codes = np.asarray(codes, dtype=np.int64).reshape(-1)
+        if (isinstance(n_samples, (int, np.integer)) and n_samples >= 0
+                and (indices.size == 0 or (indices[order[0]] >= 0 and indices[order[-1]] < n_samples))
+                and (codes is None or codes.size == indices.size)):
+            self.indices = indices[order]
+            self.codes = None if codes is None else codes[order]
+            self.n_samples = int(n_samples)
+        else:
+            raise ValueError(
+                "Inappropriate type or value of one of the arguments. Please read carefully class docstring.")
+
+    @classmethod
+    def from_dense(cls, markers):
+        """Create events from dense one-dimensional markers signal, where non-zero samples are events and their
+        values are event codes (codes are skipped if all of them are equal to 1).
+
+        Parameters
+        ----------
+        markers : 1D numpy.ndarray
+            Dense markers signal, e.g. array of zeros and ones.
+
+        Returns
+        -------
+        events : Events
+            Sparse events.
+        """
+        if isinstance(markers, np.ndarray) and markers.ndim == 1:
+            indices = np.flatnonzero(markers)
+            values = markers[indices]
+            codes = None if np.all(values == 1) else values
+            return cls(indices, markers.size, codes)
+        else:
+            raise ValueError("Inappropriate type or shape of the argument. It should be 1D numpy.ndarray.")
+
+    def to_dense(self, dtype=float):
+        """Convert events to dense one-dimensional markers signal of length 'n_samples'. Codes of events which share
+        the same sample are summed up.
+
+        Parameters
+        ----------
+        dtype : numpy.dtype
+            Data type of the markers signal. Default value is float.
+
+        Returns
+        -------
+        markers : 1D numpy.ndarray
+            Dense markers signal.
+        """
+        weights = None if self.codes is None else self.codes
+        return np.bincount(self.indices, weights=weights, minlength=self.n_samples).astype(dtype)
+
+    def between(self, start, stop):
+        """Return sample indices of the events occuring in range [start, stop).
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of samples.
+
+        Returns
+        -------
+        indices : 1D numpy.ndarray of int64
+            Sample indices of the events.
+        """
+        lo, hi = np.searchsorted(self.indices, [start, stop], side='left')
+        return self.indices[lo:hi]
+
+    def __len__(self):
+        return self.indices.size
+
+    def __repr__(self):
+        return "Events(n_events={}, n_samples={}, codes={})".format(len(self), self.n_samples,
+                                                                    self.codes is not None)
+
+
+def markers_are_valid(markers, n_samples):
+    """Check whether markers describe single occurences in a signal of 'n_samples' samples, ie. they are dense
+    one-dimensional array of zeros and ones of size 'n_samples' or Events with unique indices and 'n_samples'.
+
+    Parameters
+    ----------
+    markers : 1D numpy.ndarray | Events
+        Markers to check.
+    n_samples : int
+        Number of samples in the signal.
+
+    Returns
+    -------
+    verdict : boolean
+        Return True, if 'markers' are valid. Otherwise, return False.
+    """
+    if isinstance(markers, Events):
+        return markers.n_samples == n_samples and bool(np.all(np.diff(markers.indices) > 0))
+    else:
+        return (isinstance(markers, np.ndarray) and markers.ndim == 1 and markers.size == n_samples
+                and ndarray_contains_only(markers, np.array([0, 1])))
+
+
+def marker_indices(markers):
+    """Return sorted sample indices of the markers given as dense one-dimensional signal or Events.
+
+    Parameters
+    ----------
+    markers : 1D numpy.ndarray | Events
+        Markers.
+
+    Returns
+    -------
+    indices : 1D numpy.ndarray of int64
+        Sample indices of the markers.
+    """
+    if isinstance(markers, Events):
+        return markers.indices
+    else:
+        return np.flatnonzero(markers)
+
+
+def mark_photodiode_changes(sig, threshold, wait_n_samples, direction='left-to-right', return_indices=False,
+                            sparse=False):
     """Create one-dimensional array of zeros and ones, where ones indicate places where photodiode signal exceeds some
     specific threshold value. This one-dimensional array is the same length as photodiode signal.
 
+    Only samples exceeding the threshold are visited (in order of the analysis direction), and each next marker is
+    found with binary search, so the cost depends on the number of markers rather than the signal length.
+
     Parameters
     ----------
     sig : 1D numpy.ndarray
@@ -98,50 +563,83 @@ def mark_photodiode_changes(sig, threshold, wait_n_samples, direction='left-to-r
         Direction in which photodiode signal course will be analyzed and marked. There are three directions, ie.
         'left-to-right', 'right-to-left', 'both'. In case of 'both' photodiode signal course will be first analyzed
         'left-to-right' and than 'right-to-left'. Default value is 'left-to-right'.
+    return_indices : boolean
+        If True, beside of markers, function will return also sorted sample indices of the markers. Default value is
+        False.
+    sparse : boolean
+        If True, function will return only Events instead of dense markers (and indices). Default value is False.
 
     Returns
     -------
     markers : 1D numpy.ndarray
-        Array of zeros and ones, where ones are markers.
+        Array of zeros and ones, where ones are markers. In case of 'both' direction, samples marked in both
+        directions are equal to two.
+    indices : 1D numpy.ndarray of int64
+        Sample indices of the markers. In case of 'both' direction, samples marked in both directions are repeated.
+    events : Events
+        Sparse markers, returned instead of 'markers' and 'indices' if 'sparse' is True.
     """
     if (isinstance(sig, np.ndarray) and sig.ndim == 1 and isinstance(threshold, float) and isinstance(wait_n_samples,
                                                                                                       int) and wait_n_samples >= 0 and direction in [
         'left-to-right', 'right-to-left', 'both']):
+        candidates = np.flatnonzero(sig > threshold)
         if direction == 'left-to-right':
-            markers = np.zeros(len(sig))
-            wait_until_next_mark = wait_n_samples
-            iterator = 0
-            for sample in sig:
-                if sample > threshold and wait_until_next_mark >= wait_n_samples:
-                    markers[iterator] = 1
-                    wait_until_next_mark = 0
-                iterator += 1
-                wait_until_next_mark += 1
-            return markers
+            indices = apply_refractory_period(candidates, wait_n_samples)
         elif direction == 'right-to-left':
-            markers = np.zeros(len(sig))
-            iterator = len(sig) - 1
-            wait_until_next_mark = wait_n_samples
-            for sample in reversed(sig):
-                if sample > threshold and wait_until_next_mark >= wait_n_samples:
-                    markers[iterator] = 1
-                    wait_until_next_mark = 0
-                iterator -= 1
-                wait_until_next_mark += 1
-            return markers
+            reversed_candidates = (sig.size - 1) - candidates[::-1]
+            indices = ((sig.size - 1) - apply_refractory_period(reversed_candidates, wait_n_samples))[::-1]
+        else:
+            _, indices_left_to_right = mark_photodiode_changes(sig, threshold, wait_n_samples,
+                                                               direction='left-to-right', return_indices=True)
+            _, indices_right_to_left = mark_photodiode_changes(sig, threshold, wait_n_samples,
+                                                               direction='right-to-left', return_indices=True)
+            indices = np.sort(np.concatenate([indices_left_to_right, indices_right_to_left]))
+
+        if sparse:
+            return Events(indices, sig.size)
+        markers = np.bincount(indices, minlength=sig.size).astype(float)
+
+        if return_indices:
+            return markers, indices
         else:
-            markers_left_to_right = mark_photodiode_changes(sig, threshold, wait_n_samples, direction='left-to-right')
-            markers_right_to_left = mark_photodiode_changes(sig, threshold, wait_n_samples, direction='right-to-left')
-            markers = markers_left_to_right + markers_right_to_left
             return markers
     else:
         raise ValueError(
             "Inappropriate type, shape or value of one of the arguments. Please read carefully function docstring.")
 
 
+def apply_refractory_period(candidates, wait_n_samples):
+    """Select events from sorted candidate sample indices, so that each selected event is at least 'wait_n_samples'
+    samples after the previously selected one. The first candidate is always selected.
+
+    Parameters
+    ----------
+    candidates : 1D numpy.ndarray of int
+        Sorted sample indices of candidate events.
+    wait_n_samples : int
+        Minimal distance in samples between selected events. Must be >= 0.
+
+    Returns
+    -------
+    selected : 1D numpy.ndarray of int64
+        Sample indices of selected events.
+    """
+    candidates = np.asarray(candidates, dtype=np.int64)
+    if wait_n_samples <= 1 or candidates.size == 0:
+        return candidates
+
+    selected = []
+    position = 0
+    while position < candidates.size:
+        selected.append(position)
+        position = np.searchsorted(candidates, candidates[position] + wait_n_samples, side='left')
+    return candidates[selected]
+
+
 # FILTERING, SMOOTHING, UP- AND DOWNSAMPLING
 def downsample(sig, d_factor):
-    """Downsample one-dimensional signal with the use of reshaping.
+    """Downsample one-dimensional signal with the use of reshaping. Signal is not anti-aliased (for anti-aliased
+    resampling of N-dimensional signals with any ratio of sampling frequencies, see 'resample').
 
     Parameters
     ----------
@@ -163,13 +661,14 @@ def downsample(sig, d_factor):
             "Inappropriate type, shape or value of one of the arguments. Please read carefully function docstring.")
 
 
-def filtfilt_butterworth(sig, sf, cf, order=1, btype='bandpass'):
-    """Two-sided Butterworth filter.
+def filtfilt_butterworth(sig, sf, cf, order=1, btype='bandpass', axis=-1):
+    """Two-sided Butterworth filter. Filter is applied in second-order sections along one axis, so that all channels
+    (or epochs) of N-dimensional signal are filtered in one call. Filter designs are cached (see butterworth_sos).
 
     Parameters
     ----------
     sig : numpy.ndarray
-        Signal to filter.
+        Signal to filter, e.g. (samples), (channels x samples) or (epochs x channels x samples).
     sf : float
         Signal sampling frequecy (number of samples per second).
     cf : float | list of float of length 2
@@ -179,31 +678,165 @@ def filtfilt_butterworth(sig, sf, cf, order=1, btype='bandpass'):
         Order of the filter. Default value is 1.
     btype : str
         One of the four filter types, ie. 'lowpass', 'highpass', 'bandstop', 'bandpass'. Default value is 'bandpass'.
+    axis : int
+        Axis of 'sig' along which the filter is applied. Default value is -1.
 
     Returns
     -------
     filtered : numpy.ndarray
         Filtered sig.
     """
-    # if (isinstance(sig, np.ndarray) and isinstance(sf, float) and sf > 0 and isinstance(cf, list)
-    #         and len(cf) in range(1, 3) and isinstance(order, int) and order in range(1, 6)
-    #         and btype in ['lowpass', 'highpass', 'bandstop', 'bandpass']):
+    if isinstance(sig, np.ndarray) and isinstance(axis, int) and -sig.ndim <= axis < sig.ndim:
+        sos = butterworth_sos(sf, cf, order=order, btype=btype)
+        return scisig.sosfiltfilt(sos, sig, axis=axis)
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
 
-    if True:
 
-        if btype == 'highpass' or btype == 'lowpass':
-            b, a = scisig.butter(order, Wn=cf / (0.5 * sf), btype=btype, analog=0, output='ba')
-            return scisig.filtfilt(b, a, sig)
-        elif btype == 'bandstop' or btype == 'bandpass':
-            b, a = scisig.butter(order, Wn=(cf[0] / (0.5 * sf), cf[1] / (0.5 * sf)), btype=btype, analog=0, output='ba')
-            return scisig.filtfilt(b, a, sig)
+def butterworth_sos(sf, cf, order=1, btype='bandpass'):
+    """Design digital Butterworth filter in second-order sections (SOS) form, which is numerically more robust than
+    numerator/denominator ('ba') form. Designs are cached in LRU cache keyed on ('sf', 'cf', 'order', 'btype'), so
+    repeated calls with the same parameters do not redesign the filter.
+
+    Parameters
+    ----------
+    sf : float
+        Signal sampling frequecy (number of samples per second). Must be > 0.
+    cf : float | list of float of length 2
+        Filter frequencies. When using btype 'lowpass' or 'highpass' use single float. When using btype 'bandstop'
+        or 'bandpass' use list of float of length 2.
+    order : int
+        Order of the filter. Must be >= 1. Default value is 1.
+    btype : str
+        One of the four filter types, ie. 'lowpass', 'highpass', 'bandstop', 'bandpass'. Default value is 'bandpass'.
+
+    Returns
+    -------
+    sos : 2D numpy.ndarray
+        Array of second-order filter coefficients of shape (n_sections, 6).
+    """
+    if btype in ['highpass', 'lowpass'] and np.size(cf) == 1:
+        cf = float(np.squeeze(cf))
+    elif btype in ['bandstop', 'bandpass'] and np.size(cf) == 2:
+        cf = tuple(float(f) for f in np.ravel(cf))
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+    if sf > 0 and int(order) == order and order >= 1:
+        # Copy is cheap and keeps the cached design safe from modifications by the caller.
+        return _butterworth_sos(float(sf), cf, int(order), btype).copy()
     else:
         raise ValueError(
             "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
 
 
+@functools.lru_cache(maxsize=128)
+def _butterworth_sos(sf, cf, order, btype):
+    return scisig.butter(order, Wn=np.asarray(cf) / (0.5 * sf), btype=btype, analog=False, output='sos')
+
+
+class ButterworthFilter:
+    """One-sided (causal) Butterworth filter for online processing. Filter state is carried between calls, so
+    a signal can be filtered block by block as the samples arrive, giving the same result as filtering the whole
+    signal at once. Filter is designed with the same parameters as in 'filtfilt_butterworth'.
+
+    Parameters
+    ----------
+    sf : float
+        Signal sampling frequecy (number of samples per second).
+    cf : float | list of float of length 2
+        Filter frequencies. When using btype 'lowpass' or 'highpass' use single float. When using btype 'bandstop'
+        or 'bandpass' use list of float of length 2.
+    order : int
+        Order of the filter. Default value is 1.
+    btype : str
+        One of the four filter types, ie. 'lowpass', 'highpass', 'bandstop', 'bandpass'. Default value is 'bandpass'.
+    axis : int
+        Axis of the blocks along which the filter is applied. Default value is -1.
+    initial : str
+        Initial filter state. Available options: 'zeros' (signal preceded by zeros, thus with the step transient at
+        the beginning), 'steady' (steady state of the step response scaled by the first sample of the signal, as
+        in 'scipy.signal.sosfilt_zi', which suppresses the transient in online processing). Default value is 'zeros'.
+    """
+
+    def __init__(self, sf, cf, order=1, btype='bandpass', axis=-1, initial='zeros'):
+        if initial not in ['zeros', 'steady']:
+            raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                             "docstring.")
+        self.sf = sf
+        self.sos = butterworth_sos(sf, cf, order=order, btype=btype)
+        self.axis = axis
+        self.initial = initial
+        self._zi = None
+
+    def process(self, block):
+        """Filter next block of the signal. Blocks may be of any size, but their other dimensions must not change
+        between calls (until 'reset'). Filter state is updated in place, but each call allocates one output array of
+        the size of the block, as 'scipy.signal.sosfilt' does not filter into a preallocated array.
+
+        Parameters
+        ----------
+        block : numpy.ndarray
+            Next samples of the signal, e.g. (samples) or (channels x samples).
+
+        Returns
+        -------
+        filtered : numpy.ndarray
+            Filtered block.
+        """
+        if not (isinstance(block, np.ndarray) and -block.ndim <= self.axis < block.ndim):
+            raise ValueError("Inappropriate type or shape of the block.")
+
+        if block.shape[self.axis] == 0:
+            # Nothing to filter (and, for the steady initial state, the first sample is not known yet).
+            return np.zeros(block.shape, dtype=np.result_type(self.sos, block))
+
+        zi_shape = list(block.shape)
+        zi_shape[self.axis] = 2
+        zi_shape = (self.sos.shape[0],) + tuple(zi_shape)
+        if self._zi is None:
+            if self.initial == 'steady':
+                # Steady state of each section (n_sections x 2) placed along the filtered axis of the block
+                steady_shape = [self.sos.shape[0]] + [1] * block.ndim
+                steady_shape[1 + self.axis % block.ndim] = 2
+                first = np.take(block, [0], axis=self.axis)
+                self._zi = scisig.sosfilt_zi(self.sos).reshape(steady_shape) * first[np.newaxis]
+            else:
+                self._zi = np.zeros(zi_shape)
+        elif self._zi.shape != zi_shape:
+            raise ValueError("Inappropriate shape of the block. It must match shape of the previous blocks.")
+
+        filtered, zf = scisig.sosfilt(self.sos, block, axis=self.axis, zi=self._zi)
+        self._zi[...] = zf
+        return filtered
+
+    def reset(self):
+        """Reset the filter state, e.g. before filtering new signal."""
+        self._zi = None
+
+    def group_delay(self, freqs):
+        """Compute group delay of the filter, ie. delay of the amplitude envelope of the signal components.
+
+        Parameters
+        ----------
+        freqs : float | 1D numpy.ndarray
+            Frequencies in Hz at which the group delay is computed.
+
+        Returns
+        -------
+        delay : float | 1D numpy.ndarray
+            Group delay in samples (divide by 'sf' to get seconds).
+        """
+        # Group delay of cascade is the sum of group delays of its sections, which avoids ill-conditioned 'ba' form.
+        w = np.atleast_1d(np.asarray(freqs, dtype=float))
+        delay = sum(scisig.group_delay((section[:3], section[3:]), w=w, fs=self.sf)[1] for section in self.sos)
+        return delay if np.ndim(freqs) > 0 else float(delay[0])
+
+
 def upsample(sig, i_factor):
-    """Upsample one-dimensional signal with the use of linear interpolation.
+    """Upsample one-dimensional signal with the use of linear interpolation (for polyphase resampling of
+    N-dimensional signals with any ratio of sampling frequencies, see 'resample').
 
     Parameters
     ----------
@@ -229,23 +862,324 @@ def upsample(sig, i_factor):
             "Inappropriate type, shape or value of one of the arguments. Please read carefully function docstring.")
 
 
+def resample(sig, sf, new_sf, axis=-1, chunk_size=None, out=None):
+    """Resample signal from 'sf' to 'new_sf' sampling frequency with polyphase FIR filtering, ie. upsampling by
+    'up', anti-aliasing low-pass filtering and downsampling by 'down', where up / down is the ratio 'new_sf' / 'sf'
+    reduced to the lowest terms. The result is the same as of scipy.signal.resample_poly with default parameters.
+
+    With 'chunk_size', output is computed in chunks of 'chunk_size' samples, each one from the corresponding input
+    segment only (extended by the length of the filter), so 'sig' may be e.g. numpy.memmap of a long recording and
+    'out' may be numpy.memmap opened for writing.
+
+    Parameters
+    ----------
+    sig : numpy.ndarray
+        N-dimensional signal to resample.
+    sf : float
+        Sampling frequency of 'sig'. Must be > 0.
+    new_sf : float
+        Sampling frequency of the resampled signal. Must be > 0.
+    axis : int
+        Axis of 'sig' along which the signal is resampled. Default value is -1.
+    chunk_size : int | None
+        Number of output samples computed at once. If None, whole output is computed at once. Default value is None.
+    out : numpy.ndarray | None
+        Array of the output shape to write the resampled signal to. Default value is None.
+
+    Returns
+    -------
+    resampled : numpy.ndarray
+        Resampled signal with ceil(n_samples * up / down) samples along 'axis'.
+    """
+    if (isinstance(sig, np.ndarray) and sf > 0 and new_sf > 0 and isinstance(axis, int)
+            and -sig.ndim <= axis < sig.ndim and (chunk_size is None or (isinstance(chunk_size, int)
+                                                                         and chunk_size >= 1))):
+        ratio = Fraction(float(new_sf)).limit_denominator() / Fraction(float(sf)).limit_denominator()
+        up, down = ratio.numerator, ratio.denominator
+        n_in = sig.shape[axis]
+        n_out = -(-n_in * up // down)
+        out_shape = sig.shape[:axis % sig.ndim] + (n_out,) + sig.shape[axis % sig.ndim + 1:]
+        if out is None:
+            out = np.empty(out_shape, dtype=np.result_type(sig.dtype, np.float64))
+        elif out.shape != out_shape:
+            raise ValueError("Inappropriate shape of 'out'. It should be {}.".format(out_shape))
+
+        if up == down:
+            out[...] = sig
+            return out
+        if chunk_size is None:
+            out[...] = scisig.resample_poly(sig, up, down, axis=axis)
+            return out
+
+        h, n_pre_remove = polyphase_filter(up, down)
+        x = np.moveaxis(sig, axis, -1)
+        y = np.moveaxis(out, axis, -1)
+        for j0 in range(0, n_out, chunk_size):
+            j1 = min(j0 + chunk_size, n_out)
+            # Input samples contributing to the output chunk. First one is a multiple of 'down', so that
+            # the polyphase output of the segment is aligned with the output of the whole signal.
+            k_lo = max(0, -(-((j0 + n_pre_remove) * down - h.size + 1) // up))
+            k_lo -= k_lo % down
+            k_hi = min(n_in - 1, (j1 - 1 + n_pre_remove) * down // up)
+            m0 = j0 + n_pre_remove - k_lo * up // down
+            segment = np.asarray(x[..., k_lo:k_hi + 1])
+            y[..., j0:j1] = scisig.upfirdn(h, segment, up, down, axis=-1)[..., m0:m0 + j1 - j0]
+        return out
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+
+
+@functools.lru_cache(maxsize=32)
+def polyphase_filter(up, down):
+    """Design (cached) anti-aliasing FIR filter for polyphase resampling by 'up' / 'down', the same as used by
+    scipy.signal.resample_poly with default parameters (Kaiser window with beta 5.0).
+
+    Parameters
+    ----------
+    up : int
+        Upsampling factor. Must be >= 1.
+    down : int
+        Downsampling factor. Must be >= 1.
+
+    Returns
+    -------
+    h : 1D numpy.ndarray
+        Filter coefficients, scaled by 'up' and padded at the beginning, so that the output of scipy.signal.upfirdn
+        is delayed by an integer number of output samples.
+    n_pre_remove : int
+        Number of the leading output samples of scipy.signal.upfirdn, which should be dropped.
+    """
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = scisig.firwin(2 * half_len + 1, 1. / max_rate, window=('kaiser', 5.0)) * up
+    n_pre_pad = down - half_len % down
+    h = np.concatenate((np.zeros(n_pre_pad), h))
+    h.setflags(write=False)
+    return h, (half_len + n_pre_pad) // down
+
+
 # MUTUAL INFORMATION
-def shannon_entropy(data):
+def shannon_entropy(data, bins=10):
     """Calculate Shannon's entropy.
 
     Parameters
     ----------
     data : 1D numpy.ndarray
         Discrete data serie.
+    bins : int
+        Number of equal-width bins of the histogram of 'data'. Default value is 10.
 
     Returns
     -------
-    shannon_entropy : 1D numpy.ndarray
-        Shanon entropy.
+    shannon_entropy : float
+        Shanon entropy in bits. Empty bins do not contribute to the entropy (0 * log(0) = 0).
     """
-    hist, _ = np.histogram(data)
+    hist, _ = np.histogram(data, bins=bins)
     probability = hist / hist.sum()
-    return -np.sum(probability * np.log2(probability))
+    return -np.sum(xlogy(probability, probability)) / np.log(2)
+
+
+def binned_entropy(data, bins=10, correction=None):
+    """Calculate Shannon's entropy of many data series at once from their histograms. Each data serie (along the
+    last axis) has its own equal-width bins between its minimum and maximum, as in 'shannon_entropy'.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Data series of shape (..., n_samples).
+    bins : int
+        Number of bins. Default value is 10.
+    correction : str | None
+        Bias correction of the entropy. Available options: None, 'miller-madow' (adds (m - 1) / (2 * n_samples),
+        where m is the number of non-empty bins). Default value is None.
+
+    Returns
+    -------
+    entropy : numpy.ndarray | float
+        Entropy in bits of shape (...).
+    """
+    if isinstance(data, np.ndarray) and data.ndim >= 1 and correction in [None, 'miller-madow']:
+        return _entropy_from_counts(_batched_counts(bin_indices(data, bins), bins), correction)
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+
+
+def binned_mutual_information(x, y, bins=10, correction=None):
+    """Calculate mutual information between many pairs of data series at once from their histograms, as
+    I(X; Y) = H(X) + H(Y) - H(X, Y).
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+        Data series of shape (..., n_samples). Their shapes must be broadcastable, e.g. one input signal against
+        many outputs for different noise levels.
+    bins : int | tuple of int of length 2
+        Number of bins for 'x' and 'y' (single value or one for each). Default value is 10.
+    correction : str | None
+        Bias correction of the entropies. Available options: None, 'miller-madow'. Default value is None.
+
+    Returns
+    -------
+    mutual_information : numpy.ndarray | float
+        Mutual information in bits of shape (...).
+    """
+    if (isinstance(x, np.ndarray) and isinstance(y, np.ndarray) and x.ndim >= 1 and y.ndim >= 1
+            and x.shape[-1] == y.shape[-1] and correction in [None, 'miller-madow']):
+        bins_x, bins_y = np.broadcast_to(bins, (2,))
+        x, y = np.broadcast_arrays(x, y)
+        indices_x = bin_indices(x, bins_x)
+        indices_y = bin_indices(y, bins_y)
+        entropy_x = _entropy_from_counts(_batched_counts(indices_x, bins_x), correction)
+        entropy_y = _entropy_from_counts(_batched_counts(indices_y, bins_y), correction)
+        entropy_xy = _entropy_from_counts(_batched_counts(indices_x * bins_y + indices_y, bins_x * bins_y),
+                                          correction)
+        return entropy_x + entropy_y - entropy_xy
+    else:
+        raise ValueError(
+            "Inappropriate type, shape or value of one of the arguments. Please read carefully function docstring.")
+
+
+def bin_indices(data, bins):
+    """Assign samples of each data serie (along the last axis) to one of 'bins' equal-width bins between minimum and
+    maximum of the serie. The last bin is closed, as in numpy.histogram.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Data series of shape (..., n_samples).
+    bins : int
+        Number of bins. Must be >= 1.
+
+    Returns
+    -------
+    indices : numpy.ndarray of int64
+        Bin indices of the samples in range [0, bins - 1].
+    """
+    lowest = data.min(axis=-1, keepdims=True)
+    highest = data.max(axis=-1, keepdims=True)
+    width = np.where(highest > lowest, highest - lowest, 1)
+    indices = np.floor((data - lowest) / width * bins).astype(np.int64)
+    return np.clip(indices, 0, bins - 1)
+
+
+def _batched_counts(indices, bins):
+    # Count bin indices of each serie with a single numpy.bincount over offset indices.
+    rows = indices.reshape(-1, indices.shape[-1])
+    offsets = np.arange(rows.shape[0])[:, np.newaxis] * bins
+    counts = np.bincount((rows + offsets).ravel(), minlength=rows.shape[0] * bins)
+    return counts.reshape(indices.shape[:-1] + (bins,))
+
+
+def _entropy_from_counts(counts, correction=None):
+    n_samples = counts.sum(axis=-1)
+    probability = counts / n_samples[..., np.newaxis]
+    entropy = -np.sum(xlogy(probability, probability), axis=-1)
+    if correction == 'miller-madow':
+        entropy += (np.count_nonzero(counts, axis=-1) - 1) / (2 * n_samples)
+    return entropy / np.log(2)
+
+
+def knn_entropy(data, k=3):
+    """Calculate differential entropy of many one-dimensional data series with Kozachenko-Leonenko k-nearest
+    neighbour estimator (no histogram, thus no choice of bins). All series are processed at once: after sorting,
+    k nearest neighbours of each value lie among k values on both of its sides. Data should not contain repeated
+    values (add tiny noise to discrete data).
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Data series of shape (..., n_samples).
+    k : int
+        Number of nearest neighbours. Must be >= 1 and < n_samples. Default value is 3.
+
+    Returns
+    -------
+    entropy : numpy.ndarray | float
+        Differential entropy in bits of shape (...).
+    """
+    if isinstance(data, np.ndarray) and data.ndim >= 1 and isinstance(k, int) and 1 <= k < data.shape[-1]:
+        rows = np.sort(data.reshape(-1, data.shape[-1]), axis=-1)
+        n_samples = rows.shape[-1]
+        # Distances to k left and k right neighbours in sorted order (inf beyond the ends of series).
+        candidates = np.full(rows.shape + (2 * k,), np.inf)
+        for offset in range(1, k + 1):
+            gaps = rows[:, offset:] - rows[:, :-offset]
+            candidates[:, offset:, offset - 1] = gaps
+            candidates[:, :-offset, k + offset - 1] = gaps
+        distances = np.partition(candidates, k - 1, axis=-1)[..., k - 1]
+        entropy = (digamma(n_samples) - digamma(k) + np.mean(np.log(2 * distances), axis=-1)) / np.log(2)
+        return entropy.reshape(data.shape[:-1])[()]
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+
+
+def ksg_mutual_information(x, y, k=3):
+    """Calculate mutual information between many pairs of one-dimensional data series with Kraskov-Stoegbauer-
+    Grassberger (KSG, algorithm 1) k-nearest neighbour estimator, which is much less biased than the binned estimator
+    for continuous data. Distances to the k-th neighbour in the joint space are found in maximum norm with a KD-tree
+    of each pair, while neighbours in marginal spaces are counted for all pairs at once by binary search in the sorted
+    series. Data should not contain repeated values (add tiny noise to discrete data).
+
+    Parameters
+    ----------
+    x, y : numpy.ndarray
+        Data series of shape (..., n_samples). Their shapes must be broadcastable, e.g. one signal against many noise
+        levels.
+    k : int
+        Number of nearest neighbours. Must be >= 1 and < n_samples. Default value is 3.
+
+    Returns
+    -------
+    mutual_information : numpy.ndarray | float
+        Mutual information in bits of shape (...).
+    """
+    if (isinstance(x, np.ndarray) and isinstance(y, np.ndarray) and x.ndim >= 1 and y.ndim >= 1
+            and x.shape[-1] == y.shape[-1] and isinstance(k, int) and 1 <= k < x.shape[-1]):
+        x, y = np.broadcast_arrays(x, y)
+        n_samples = x.shape[-1]
+        # Distances are compared in double precision, as in KD-trees.
+        rows_x = x.reshape(-1, n_samples).astype(np.float64)
+        rows_y = y.reshape(-1, n_samples).astype(np.float64)
+        # Distance to the k-th neighbour in the joint space.
+        radius = np.empty(rows_x.shape)
+        for i, (row_x, row_y) in enumerate(zip(rows_x, rows_y)):
+            points = np.column_stack([row_x, row_y])
+            radius[i] = cKDTree(points).query(points, k=k + 1, p=np.inf)[0][:, k]
+        # Numbers of neighbours strictly closer than that distance in marginal spaces (without the point itself).
+        n_xy = []
+        for rows in [rows_x, rows_y]:
+            order = np.argsort(rows, axis=-1)
+            n_xy.append(_count_sorted_neighbours(np.take_along_axis(rows, order, axis=-1),
+                                                 np.take_along_axis(radius, order, axis=-1)))
+        mutual_information = (digamma(k) + digamma(n_samples)
+                              - np.mean(digamma(n_xy[0] + 1) + digamma(n_xy[1] + 1), axis=-1)) / np.log(2)
+        return mutual_information.reshape(x.shape[:-1])[()]
+    else:
+        raise ValueError(
+            "Inappropriate type, shape or value of one of the arguments. Please read carefully function docstring.")
+
+
+def _count_sorted_neighbours(rows, radius):
+    """Return numbers of values strictly closer than 'radius' to each value (without the value itself) within its
+    row, for rows of values sorted along the last axis, by binary search on both sides of each value."""
+    n_values = rows.shape[-1]
+    positions = np.arange(n_values)
+    counts = np.zeros(rows.shape, dtype=np.intp)
+    for side in [-1, 1]:
+        found = np.zeros(rows.shape, dtype=np.intp)
+        step = 1 << (n_values - 1).bit_length()
+        while step > 0:
+            candidate = found + step
+            neighbours = positions + side * candidate
+            valid = (neighbours >= 0) & (neighbours < n_values)
+            gaps = np.abs(np.take_along_axis(rows, np.clip(neighbours, 0, n_values - 1), axis=-1) - rows)
+            found = np.where(valid & (gaps < radius), candidate, found)
+            step >>= 1
+        counts += found
+    return counts
 
 
 # SIGNAL CREATION
@@ -348,311 +1282,2096 @@ def create_square_pulse(freq, sf, amp, first_peak='positive'):
             "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
 
 
-def create_alternating_signal(duration, sf, freq, amp, s_type='sinusoidal', first_peak='positive'):
-    """Create one-dimensional alternating signal using sawtooth, sinusoidal or square wave.
+def create_alternating_signal(duration, sf, freq, amp, s_type='sinusoidal', first_peak='positive', out=None):
+    """Create one-dimensional alternating signal using sawtooth, sinusoidal or square wave.
+
+    Waveform is evaluated in closed form from the phase of each sample on one global time scale, so there is no phase
+    error accumulated over periods, even if 'freq' does not divide 'sf'. Signal is created in place in blocks of
+    fixed size, ie. without temporary arrays of the signal length.
+
+    Parameters
+    ----------
+    duration : float
+        Duration of the signal in seconds. Must be > 0.
+    sf : int
+        Sampling frequency of the pulse (number of samples per second). Must be > 0.
+    freq : float
+        Frequency of the signal in Hz.
+    amp : float
+        Amplitude of the pulse in microampers (uA). Must be > 0.
+    s_type : str
+        Type of the wave used in the signal creation. Available types: 'sawtooth', sinusoidal', 'square'.
+        Default value is 'sinusoidal'.
+    first_peak : str
+        Polarity of the first pulse hillock. Available options: 'positive', 'negative'. Default value is 'positive'.
+    out : 1D numpy.ndarray | None
+        Float array of size round(duration * sf) to write the signal to. Default value is None.
+
+    Returns
+    -------
+    sig : 1D numpy.ndarray
+        Created one-dimensional alternating signal.
+    """
+    if (isinstance(duration, float) and duration > 0 and isinstance(sf, int) and sf > 0 and isinstance(freq, float)
+            and freq > 0 and isinstance(amp, float) and amp > 0 and s_type in ['sawtooth', 'sinusoidal', 'square']
+            and first_peak in ['positive', 'negative'] and duration * sf >= 1):
+
+        n_samples = int(np.around(duration * sf, decimals=0))
+        if out is None:
+            out = np.empty(n_samples)
+        elif not (isinstance(out, np.ndarray) and out.shape == (n_samples,) and out.dtype.kind == 'f'):
+            raise ValueError("Inappropriate 'out'. It should be 1D float numpy.ndarray of size {}.".format(n_samples))
+
+        scale = (amp / 2) * (1 if first_peak == 'positive' else -1)
+        block_size = min(n_samples, 2 ** 16)
+        block_indices = np.arange(block_size, dtype=float)
+        for start in range(0, n_samples, block_size):
+            block = out[start:start + block_size]
+            # Phase of each sample as a fraction of the period.
+            np.add(block_indices[:block.size], start, out=block)
+            block *= freq
+            block /= sf
+            np.mod(block, 1.0, out=block)
+
+            if s_type == 'sinusoidal':
+                block *= 2 * np.pi
+                np.sin(block, out=block)
+            elif s_type == 'sawtooth':
+                block *= 2
+                block -= 1
+            else:
+                block *= 2
+                np.floor(block, out=block)
+                block *= -2
+                block += 1
+            block *= scale
+
+        sig = out
+        return sig
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+
+
+class PulseBank:
+    """Bank of one-period pulses (see 'create_sawtooth_pulse', 'create_sin_pulse', 'create_square_pulse'). Each pulse
+    shape is computed once per ('freq', 'sf', 's_type', 'first_peak') at unit amplitude and pulses of a given
+    amplitude are scaled from it once and then returned from the bank as read-only arrays.
+
+    Example of the pulses used in the stimulation protocol:
+    > bank = PulseBank()
+    > for duration in [10, 50, 100]:
+    >     for amplitude in [100, 200, 300]:
+    >         pulse = bank.get(1000 / duration, 1000, amplitude)
+    > pulses, lengths, keys = bank.export()
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._pulses = {}
+
+    def template(self, freq, sf, s_type='sinusoidal', first_peak='positive'):
+        """Return one-period pulse of unit amplitude (computed only on the first request).
+
+        Parameters
+        ----------
+        freq : float
+            Frequency of the pulse wave in Hz. Must be > 0.
+        sf : int
+            Sampling frequency of the pulse (number of samples per second). Must be > 0.
+        s_type : str
+            Type of the wave. Available types: 'sawtooth', sinusoidal', 'square'. Default value is 'sinusoidal'.
+        first_peak : str
+            Polarity of the first pulse hillock. Available options: 'positive', 'negative'. Default value is
+            'positive'.
+
+        Returns
+        -------
+        pulse : 1D numpy.ndarray
+            Read-only one-period pulse of unit amplitude.
+        """
+        key = (float(freq), sf, s_type, first_peak)
+        if key not in self._templates:
+            if s_type == 'sawtooth':
+                pulse = create_sawtooth_pulse(float(freq), sf, 1.0, first_peak=first_peak)
+            elif s_type == 'sinusoidal':
+                pulse, _ = create_sin_pulse(float(freq), sf, 1.0, first_peak=first_peak)
+            elif s_type == 'square':
+                pulse = create_square_pulse(float(freq), sf, 1.0, first_peak=first_peak)
+            else:
+                raise ValueError("Inappropriate s_type. It should be 'sawtooth', 'sinusoidal' or 'square'.")
+            pulse.setflags(write=False)
+            self._templates[key] = pulse
+        return self._templates[key]
+
+    def get(self, freq, sf, amp, s_type='sinusoidal', first_peak='positive'):
+        """Return one-period pulse of a given amplitude, equal to the pulse created with 'create_sawtooth_pulse',
+        'create_sin_pulse' or 'create_square_pulse'.
+
+        Parameters
+        ----------
+        freq : float
+            Frequency of the pulse wave in Hz. Must be > 0.
+        sf : int
+            Sampling frequency of the pulse (number of samples per second). Must be > 0.
+        amp : float
+            Amplitude of the pulse in microamperes (uA). Must be > 0.
+        s_type : str
+            Type of the wave. Available types: 'sawtooth', sinusoidal', 'square'. Default value is 'sinusoidal'.
+        first_peak : str
+            Polarity of the first pulse hillock. Available options: 'positive', 'negative'. Default value is
+            'positive'.
+
+        Returns
+        -------
+        pulse : 1D numpy.ndarray
+            Read-only one-period pulse.
+        """
+        if not amp > 0:
+            raise ValueError("Amplitude must be > 0.")
+        key = (float(freq), sf, s_type, first_peak, float(amp))
+        if key not in self._pulses:
+            pulse = self.template(freq, sf, s_type, first_peak) * float(amp)
+            pulse.setflags(write=False)
+            self._pulses[key] = pulse
+        return self._pulses[key]
+
+    def export(self):
+        """Export all pulses of the bank (in order of their creation) as one contiguous array.
+
+        Returns
+        -------
+        pulses : 2D numpy.ndarray
+            Pulses of shape (n_pulses, max_pulse_length), padded with zeros at the end.
+        lengths : 1D numpy.ndarray of int
+            Number of samples of each pulse.
+        keys : list of tuple
+            Parameters ('freq', 'sf', 's_type', 'first_peak', 'amp') of each pulse.
+        """
+        keys = list(self._pulses)
+        lengths = np.array([self._pulses[key].size for key in keys], dtype=int)
+        pulses = np.zeros((len(keys), lengths.max() if keys else 0))
+        for i, key in enumerate(keys):
+            pulses[i, :lengths[i]] = self._pulses[key]
+        return pulses, lengths, keys
+
+
+def band_limited_noise(min_freq, max_freq, samples, sf, n_realizations=None, kind='uniform', rng=None):
+    """Create band-limited random noise, ie. noise with spectrum non-zero only in range [min_freq, max_freq], e.g. for
+    transcranial random noise stimulation (tRNS). Noise is created by setting random spectrum of real signal (half
+    spectrum only) and computing its inverse real FFT. Many realizations are created in one call.
+
+    Parameters
+    ----------
+    min_freq : float
+        Lower edge of the frequency band in Hz. Must be >= 0.
+    max_freq : float
+        Upper edge of the frequency band in Hz. Must be >= 'min_freq'.
+    samples : int
+        Number of samples of each realization. Must be >= 1.
+    sf : float
+        Sampling frequency (number of samples per second). Must be > 0.
+    n_realizations : int | None
+        Number of realizations of the noise. If None, single one-dimensional realization is returned. Default value
+        is None.
+    kind : str
+        Type of the spectrum in the band. Available options: 'uniform' - flat magnitude with random phases,
+        'gaussian' - complex Gaussian random values. Default value is 'uniform'.
+    rng : None | int | numpy.random.Generator
+        Random generator (or seed for numpy.random.default_rng). Default value is None.
+
+    Returns
+    -------
+    noise : 1D or 2D numpy.ndarray
+        Noise of shape (samples) or (n_realizations x samples).
+    """
+    if (0 <= min_freq <= max_freq and isinstance(samples, int) and samples >= 1 and sf > 0
+            and (n_realizations is None or (isinstance(n_realizations, int) and n_realizations >= 1))
+            and kind in ['uniform', 'gaussian']):
+        rng = np.random.default_rng(rng)
+        band = band_indices(min_freq, max_freq, samples, sf)
+        n = 1 if n_realizations is None else n_realizations
+
+        spectrum_half = np.zeros((n, samples // 2 + 1), dtype=complex)
+        if kind == 'uniform':
+            phases = rng.random((n, band.size)) * (2 * np.pi)
+            # Zero frequency and Nyquist frequency bins of real signal are real.
+            phases[:, (band == 0) | (2 * band == samples)] = 0
+            spectrum_half[:, band] = np.exp(1j * phases)
+        else:
+            spectrum_half[:, band] = rng.standard_normal((n, band.size)) + 1j * rng.standard_normal((n, band.size))
+        noise = np.fft.irfft(spectrum_half, n=samples, axis=-1)
+
+        return noise[0] if n_realizations is None else noise
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+
+
+@functools.lru_cache(maxsize=64)
+def band_indices(min_freq, max_freq, samples, sf):
+    """Return (cached) indices of the real FFT frequency bins in range [min_freq, max_freq], ie. the band mask.
+
+    Parameters
+    ----------
+    min_freq, max_freq : float
+        Edges of the frequency band in Hz.
+    samples : int
+        Number of samples of the signal.
+    sf : float
+        Sampling frequency of the signal.
+
+    Returns
+    -------
+    band : 1D numpy.ndarray of int
+        Read-only indices of the frequency bins of numpy.fft.rfft output.
+    """
+    freqs = np.fft.rfftfreq(samples, 1 / sf)
+    band = np.flatnonzero((freqs >= min_freq) & (freqs <= max_freq))
+    band.setflags(write=False)
+    return band
+
+
+# SIMPLE CALCULATIONS
+def z_score(x, avg, sd):
+    """Calculate z-score.
+
+    Parameters
+    ----------
+    x : float
+        Standardized variable..
+    avg : float
+        Average from population.
+    sd : float
+        Standard deviation from population.
+
+    Returns
+    -------
+    z : float
+        Z-score.
+    """
+    return (x - avg) / sd
+
+
+def create_time_scale(n_samples, sf, unit='s'):
+    """Create one-dimensional time scale.
+
+    Parameters
+    ----------
+    n_samples : int
+        Total number of samples in the signal for which time scale has to be created.
+    sf : int
+        Sampling frequency of the signal, ie. number of samples per second.
+    unit : str
+        Time unit in which time scale has to be expressed. Available units: hours 'h', minutes 'min', seconds 's',
+        milliseconds 'ms', microseconds 'us', nanoseconds 'ns'. Default value is 's'.
+
+    Returns
+    -------
+    time_scale : 1D np.ndarray
+        One-dimensional time scale with values expressed in a specific time unit.
+    """
+    if (isinstance(n_samples, int) and isinstance(sf, int) and unit in ['h', 'min', 's', 'ms', 'us', 'ns']):
+        unit_convertion = {'h': 3600, 'min': 60, 's': 1, 'ms': 0.001, 'us': 0.000001, 'ns': 0.000000001}
+        total_time_in_unit = (n_samples / sf) / unit_convertion[unit]
+        dt = (1 / sf) / unit_convertion[unit]
+        time_scale = np.arange(0, total_time_in_unit, dt)
+        return time_scale
+    else:
+        raise ValueError(
+            "Innapriopriate type or value of one of the arguments. Please read carefully function docstring.")
+
+
+def list_is_int(list_of_ints):
+    """Check whether given list contains only int values.
+
+    Parameters
+    ----------
+    list_of_ints : list
+        List of presumably only int values.
+
+    Returns
+    -------
+    verdict : boolean
+        Return True, if 'list_of_ints" contains only in values. Otherwise, return False.
+    """
+    if (isinstance(list_of_ints, list) and len(list_of_ints) > 0):
+        for item in list_of_ints:
+            if not isinstance(item, int):
+                return False
+        return True
+    else:
+        raise ValueError("Inappropriate type or size of the argument.")
+
+
+def ndarray_contains_only(ndarray, values):
+    """Check whether numpy.ndarray contains only some specific values.
+
+    Parameters
+    ----------
+    ndarray : numpy.ndarray
+        One-dimensional array.
+    values : 1D numpy.ndarray
+        One-dimensional array with values to check whether they occur in 'ndarray'.
+
+    Returns
+    -------
+    verdict : boolean
+        Return True, if 'ndarray' contains only 'values'. Otherwise, return False.
+
+    """
+    if (isinstance(ndarray, np.ndarray) and ndarray.ndim == 1 and isinstance(values, np.ndarray) and values.ndim == 1):
+        mask = np.isin(ndarray, values)
+        matches = np.sum(mask)
+        if matches != ndarray.size:
+            return False
+        else:
+            return True
+    else:
+        raise ValueError("Inappropriate type or shape of the argument.")
+
+
+def twodim_to_onedim_list(twodim_list):
+    return list(chain.from_iterable(twodim_list))
+
+
+# TRANSFORMATIONS AND CORRECTIONS
+def baseline_correction(sig, b_window, c_window, b_type='absolute'):
+    """Perform baseline correction on a given one-dimensional signal.
+
+    Parameters
+    ----------
+    sig : 1D numpy.ndarray
+        One-dimensional signal for which baseline correction has to be performed.
+    b_window : list of int of length 2
+        Range of the 'sig' samples from which baseline should be calculated. Minimum and maximum range
+        is [0, sig.size-1].
+    c_window : list of int of length 2
+        Range of the 'sig' samples which should be baseline-corrected. Minimum and maximum range is [0, sig.size-1].
+    b_type : str
+        Type of baseline. Available options: 'absolute', 'relative', 'relchange', 'decibel' (based on
+        http://bjornherrmann.com/baseline_correction.html). Default values is 'absolute'. For 'X' is the signal
+        and for 'B' is the baseline calculated as mean(sig[window[0]:window[1]]):
+        1. 'absolute' - absolute baseline, range of possible values: [-inf, inf], calculated as X - B;
+        2. 'relative' - relative baseline, range of possible values: [0, inf], calculated as X / B;
+        3. 'relchange' - relative change baseline, range of possible values: [-1, inf], calculated as (X - B) / B;
+        4. 'decibel' - decibel baseline (defined only for power), range of possible values: [-inf, inf], calculated as
+        10 * log10(X / B).
+
+    Returns
+    -------
+    corrected : numpy.ndarray
+        Baseline-corrected signal.
+    """
+    if (isinstance(sig, np.ndarray) and sig.ndim == 1 and isinstance(b_window, list) and list_is_int(b_window)
+            and len(b_window) in range(1, 3) and isinstance(c_window, list) and list_is_int(c_window)
+            and len(c_window) in range(1, 3) and b_type in ['absolute', 'relative', 'relchange', 'decibel']):
+
+        baseline = np.mean(sig[b_window[0]:b_window[1]])
+
+        if b_type == 'absolute':
+            sig[c_window[0]:c_window[1]] -= baseline
+        elif b_type == 'relative':
+            sig[c_window[0]:c_window[1]] /= baseline
+        elif b_type == 'relchange':
+            sig[c_window[0]:c_window[1]] = (sig[c_window[0]:c_window[1]] - baseline) / baseline
+        else:
+            sig[c_window[0]:c_window[1]] = 10 * np.log10(sig[c_window[0]:c_window[1]] / baseline)
+
+        return sig
+    else:
+        raise ValueError(
+            "Inappropriate type, value or shape of one of the arguments. Please read carefully function docstring.")
+
+
+def hanning_correction(sig, c_window, mode='full'):
+    """Perform Hanning window correction on a given one-dimensional signal.
+
+    Parameters
+    ----------
+    sig : 1D numpy.ndarray
+        One-dimensional signal.
+    c_window : list of int of length 2
+        Range of the 'sig' samples which should be Hanning-corrected. Minimum and maximum range is [0, sig.size-1].
+    mode : str
+        Mode of the Hanning correction. There are three available modes: 'half-left', 'half-right', 'full'.
+        Default value is 'full'. Modes description:
+        1. 'half-left' - only half left part of the Hanning window is used for the correction.
+        2. 'half-right' - only half right part of the Hanning window is used for the correction.
+        3. 'full' - full Hanning window is used for the correction.
+
+    Returns
+    -------
+    corrected : 1D numpy.ndarray
+        Hanning-corrected signal.
+    """
+    if (isinstance(sig, np.ndarray) and sig.ndim == 1 and list_is_int(c_window) and len(c_window) in range(1, 3)
+            and mode in ['half-left', 'half-right', 'full']):
+
+        c_window_size = sig[c_window[0]:c_window[1]].size
+        if mode == 'half-left':
+            hann = np.hanning(c_window_size * 2)[:c_window_size]
+            sig[c_window[0]:c_window[1]] = np.multiply(sig[c_window[0]:c_window[1]], hann)
+        elif mode == 'half-right':
+            hann = np.hanning(c_window_size * 2)[c_window_size:]
+            sig[c_window[0]:c_window[1]] = np.multiply(sig[c_window[0]:c_window[1]], hann)
+        else:
+            hann = np.hanning(c_window_size)
+            sig[c_window[0]:c_window[1]] = np.multiply(sig[c_window[0]:c_window[1]], hann)
+        return sig
+    else:
+        raise ValueError(
+            "Inappropriate type, value or shape of one of the arguments. Please read carefully function docstring.")
+
+
+def baseline_correct_epochs(data, times, b_window, c_window=None, b_type='absolute', axis=-1, out=None):
+    """Perform baseline correction on N-dimensional data, e.g. (epochs x channels x samples), along time axis in one
+    broadcast operation. Windows are expressed in time units of 'times' and each window includes its start and
+    excludes its end.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Data for which baseline correction has to be performed.
+    times : 1D numpy.ndarray
+        Sorted time points of the samples along 'axis', e.g. in seconds.
+    b_window : list | tuple of float of length 2
+        Time window from which baseline (mean over time) should be calculated.
+    c_window : list | tuple of float of length 2 | None
+        Time window which should be baseline-corrected. If None, whole data is corrected. Default value is None.
+    b_type : str
+        Type of baseline. Available options: 'absolute', 'relative', 'relchange', 'decibel' (see
+        'baseline_correction'). Default value is 'absolute'.
+    axis : int
+        Time axis of 'data'. Default value is -1.
+    out : numpy.ndarray | None
+        Float array of the shape of 'data' to write the corrected data to ('data' itself for in-place correction).
+        If None, new array is returned and 'data' is left untouched. Default value is None.
+
+    Returns
+    -------
+    corrected : numpy.ndarray
+        Baseline-corrected data.
+    """
+    if (isinstance(data, np.ndarray) and isinstance(times, np.ndarray) and times.ndim == 1
+            and isinstance(axis, int) and -data.ndim <= axis < data.ndim and data.shape[axis] == times.size
+            and len(b_window) == 2 and (c_window is None or len(c_window) == 2)
+            and b_type in ['absolute', 'relative', 'relchange', 'decibel']):
+
+        out = _prepare_out(data, out)
+        x = np.moveaxis(out, axis, -1)
+        b_start, b_stop = np.searchsorted(times, b_window, side='left')
+        c_start, c_stop = (0, times.size) if c_window is None else np.searchsorted(times, c_window, side='left')
+
+        baseline = x[..., b_start:b_stop].mean(axis=-1, keepdims=True)
+        corrected = x[..., c_start:c_stop]
+        if b_type == 'absolute':
+            corrected -= baseline
+        elif b_type == 'relative':
+            corrected /= baseline
+        elif b_type == 'relchange':
+            corrected -= baseline
+            corrected /= baseline
+        else:
+            corrected /= baseline
+            np.log10(corrected, out=corrected)
+            corrected *= 10
+
+        return out
+    else:
+        raise ValueError(
+            "Inappropriate type, value or shape of one of the arguments. Please read carefully function docstring.")
+
+
+def hanning_correct_epochs(data, times, c_window, mode='full', axis=-1, out=None):
+    """Perform Hanning window correction on N-dimensional data, e.g. (epochs x channels x samples), along time axis in
+    one broadcast operation. Window is expressed in time units of 'times' and includes its start and excludes its end.
+    Hanning tapers are cached per size and mode.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Data for which Hanning correction has to be performed.
+    times : 1D numpy.ndarray
+        Sorted time points of the samples along 'axis', e.g. in seconds.
+    c_window : list | tuple of float of length 2
+        Time window which should be Hanning-corrected.
+    mode : str
+        Mode of the Hanning correction. Available modes: 'half-left', 'half-right', 'full' (see
+        'hanning_correction'). Default value is 'full'.
+    axis : int
+        Time axis of 'data'. Default value is -1.
+    out : numpy.ndarray | None
+        Float array of the shape of 'data' to write the corrected data to ('data' itself for in-place correction).
+        If None, new array is returned and 'data' is left untouched. Default value is None.
+
+    Returns
+    -------
+    corrected : numpy.ndarray
+        Hanning-corrected data.
+    """
+    if (isinstance(data, np.ndarray) and isinstance(times, np.ndarray) and times.ndim == 1
+            and isinstance(axis, int) and -data.ndim <= axis < data.ndim and data.shape[axis] == times.size
+            and len(c_window) == 2 and mode in ['half-left', 'half-right', 'full']):
+
+        out = _prepare_out(data, out)
+        x = np.moveaxis(out, axis, -1)
+        c_start, c_stop = np.searchsorted(times, c_window, side='left')
+        x[..., c_start:c_stop] *= hanning_taper(int(c_stop - c_start), mode)
+
+        return out
+    else:
+        raise ValueError(
+            "Inappropriate type, value or shape of one of the arguments. Please read carefully function docstring.")
+
+
+@functools.lru_cache(maxsize=64)
+def hanning_taper(size, mode='full'):
+    """Return (cached) Hanning taper of a given size, the same as used in 'hanning_correction'.
+
+    Parameters
+    ----------
+    size : int
+        Number of samples of the taper.
+    mode : str
+        Part of the Hanning window. Available modes: 'half-left', 'half-right', 'full'. Default value is 'full'.
+
+    Returns
+    -------
+    taper : 1D numpy.ndarray
+        Read-only Hanning taper.
+    """
+    if mode == 'half-left':
+        taper = np.hanning(size * 2)[:size]
+    elif mode == 'half-right':
+        taper = np.hanning(size * 2)[size:]
+    else:
+        taper = np.hanning(size)
+    taper.setflags(write=False)
+    return taper
+
+
+def _prepare_out(data, out):
+    # Copy data into float output array, unless data is corrected in place.
+    if out is None:
+        return np.array(data, dtype=np.result_type(data.dtype, 1.0))
+    if out.shape != data.shape:
+        raise ValueError("Inappropriate shape of 'out'. It should be {}.".format(data.shape))
+    if out is not data:
+        out[...] = data
+    return out
+
+
+def spectrum(sig, time_scale, abs=True):
+    """Compute the one-dimensional Discrete Fourier Transform (DFT) for given N-dimensional signal. For power spectral
+    density estimates (Welch or multitaper) see 'power_spectral_density'.
+
+    Parameters
+    ----------
+    sig : numpy.ndarray
+        Signal for DFT (can be complex).
+    time_scale : 1D numpy.ndarray
+        One-dimensional time scale in seconds.
+    abs : boolean
+        If True, the result of DFT will be absolute, thus converted from complex to real space and contain information only
+         about signal magnitude. If False, the result of DFT will be complex. Default value is True.
+
+    Returns
+    -------
+    freqs : 1D numpy.ndarray
+        One-dimensional array containing information about the signal frequencies.
+    fft : numpy.ndarray or complex numpy.ndarray
+        One-dimensional array containing the result of DFT. If parameter 'abs' is equal to False, the result will
+        be complex numpy.ndarray.
+    """
+    # if (isinstance(sig, np.ndarray) and isinstance(time_scale, np.ndarray) and time_scale.ndim == 1):
+    if True:
+        freqs = scifft.fftfreq(sig.size, d=time_scale[1] - time_scale[0])
+        fft = np.fft.fft(sig)
+        if abs:
+            return freqs, np.abs(fft)
+        else:
+            return freqs, fft
+    else:
+        raise ValueError(
+            "Inappropriate type or shape of one of the arguments. Please read carefully function docstring.")
+
+
+def power_spectral_density(sig, sf, method='welch', axis=-1, nperseg=None, noverlap=None, window='hann', nw=4.0,
+                           n_tapers=None, detrend=True, chunk_size=None):
+    """Estimate one-sided power spectral density (PSD) of N-dimensional real signal along one axis with real FFT.
+    Two methods are available:
+    1. 'welch' - Welch's method, ie. average of periodograms of overlapping segments tapered by 'window' (the same
+    as scipy.signal.welch with default detrending and 'density' scaling).
+    2. 'multitaper' - multitaper method, ie. average of periodograms tapered by 'n_tapers' discrete prolate
+    spheroidal sequences (DPSS) with time-halfbandwidth product 'nw'. By default whole signal is a single segment,
+    but it can be divided into overlapping segments like in Welch's method.
+    Segment spectra are accumulated over groups of 'chunk_size' segments, so that with 'chunk_size' the signal may be
+    e.g. numpy.memmap of a long recording, which is read only one group of segments at a time.
+
+    Parameters
+    ----------
+    sig : numpy.ndarray
+        N-dimensional real signal, e.g. (samples), (channels x samples) or (epochs x channels x samples).
+    sf : float
+        Sampling frequency of the signal. Must be > 0.
+    method : str
+        Method of estimation. Available options: 'welch', 'multitaper'. Default value is 'welch'.
+    axis : int
+        Axis of 'sig' along which PSD is estimated. Default value is -1.
+    nperseg : int | None
+        Number of samples of each segment. If None, it is min(256, n_samples) for 'welch' and n_samples for
+        'multitaper'. Default value is None.
+    noverlap : int | None
+        Number of samples of overlap between segments. If None, it is nperseg // 2. Default value is None.
+    window : str | tuple
+        Window used in 'welch' method (see scipy.signal.get_window). Default value is 'hann'.
+    nw : float
+        Time-halfbandwidth product of DPSS tapers used in 'multitaper' method. Default value is 4.0.
+    n_tapers : int | None
+        Number of DPSS tapers used in 'multitaper' method. If None, it is 2 * nw - 1. Default value is None.
+    detrend : boolean
+        If True, mean of each segment is removed before tapering. Default value is True.
+    chunk_size : int | None
+        Number of segments processed at once. If None, all segments are processed at once. Default value is None.
+
+    Returns
+    -------
+    freqs : 1D numpy.ndarray
+        Frequencies of the PSD in Hz.
+    psd : numpy.ndarray
+        PSD in units**2/Hz with frequencies along 'axis'.
+    """
+    if not (isinstance(sig, np.ndarray) and sf > 0 and method in ['welch', 'multitaper'] and isinstance(axis, int)
+            and -sig.ndim <= axis < sig.ndim and (chunk_size is None or (isinstance(chunk_size, int)
+                                                                         and chunk_size >= 1))):
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+
+    x = np.moveaxis(sig, axis, -1)
+    n_samples = x.shape[-1]
+    if nperseg is None:
+        nperseg = min(256, n_samples) if method == 'welch' else n_samples
+    if noverlap is None:
+        noverlap = nperseg // 2
+    if not (1 <= nperseg <= n_samples and 0 <= noverlap < nperseg):
+        raise ValueError("Inappropriate 'nperseg' or 'noverlap'. Segments must fit into the signal.")
+
+    if method == 'welch':
+        tapers = scisig.get_window(window, nperseg)[np.newaxis, :]
+    else:
+        tapers = dpss_tapers(nperseg, float(nw), n_tapers)
+    scale = 1.0 / (sf * np.sum(tapers[0] ** 2))
+
+    step = nperseg - noverlap
+    n_segments = (n_samples - noverlap) // step
+    if chunk_size is None:
+        chunk_size = n_segments
+
+    psd = np.zeros(x.shape[:-1] + (nperseg // 2 + 1,))
+    for first in range(0, n_segments, chunk_size):
+        last = min(first + chunk_size, n_segments)
+        block = np.asarray(x[..., first * step:(last - 1) * step + nperseg], dtype=float)
+        segments = np.lib.stride_tricks.sliding_window_view(block, nperseg, axis=-1)[..., ::step, :]
+        if detrend:
+            segments = segments - segments.mean(axis=-1, keepdims=True)
+        # Shape (..., segments, tapers, freqs), summed over segments and tapers.
+        spectra = np.fft.rfft(segments[..., np.newaxis, :] * tapers, axis=-1)
+        psd += np.sum(spectra.real ** 2 + spectra.imag ** 2, axis=(-3, -2))
+    psd *= scale / (n_segments * tapers.shape[0])
+
+    # One-sided spectrum: double all frequencies except zero and Nyquist frequency.
+    if nperseg % 2:
+        psd[..., 1:] *= 2
+    else:
+        psd[..., 1:-1] *= 2
+
+    freqs = np.fft.rfftfreq(nperseg, 1 / sf)
+    return freqs, np.moveaxis(psd, -1, axis)
+
+
+def dpss_tapers(n, nw, n_tapers=None):
+    """Return (cached) discrete prolate spheroidal sequences (DPSS, Slepian tapers) used in multitaper spectral
+    estimation. Each taper has unit energy.
+
+    Parameters
+    ----------
+    n : int
+        Number of samples of each taper.
+    nw : float
+        Time-halfbandwidth product.
+    n_tapers : int | None
+        Number of tapers. If None, it is 2 * nw - 1. Default value is None.
+
+    Returns
+    -------
+    tapers : 2D numpy.ndarray
+        Read-only tapers of shape (n_tapers, n).
+    """
+    if n_tapers is None:
+        n_tapers = max(1, int(2 * nw) - 1)
+    return _dpss_tapers(int(n), float(nw), int(n_tapers))
+
+
+@functools.lru_cache(maxsize=32)
+def _dpss_tapers(n, nw, n_tapers):
+    tapers = np.atleast_2d(scisig.windows.dpss(n, nw, Kmax=n_tapers, norm=2))
+    tapers.setflags(write=False)
+    return tapers
+
+
+def new_range(signal, new_min, new_max):
+    """Linearly rescale the signal from its own range to range [new_min, new_max]. Constant signal is mapped to
+    'new_min'.
+
+    Parameters
+    ----------
+    signal : numpy.ndarray
+        Signal to rescale.
+    new_min, new_max : float
+        New range of the signal.
+
+    Returns
+    -------
+    new_signal : numpy.ndarray
+        Rescaled signal.
+    """
+    signal = np.asarray(signal)
+    return shared_rescale([signal], new_min, new_max, dtype=np.result_type(signal.dtype, 1.0))[0]
+
+
+def shared_extrema(arrays, chunk_size=2 ** 22):
+    """Calculate minimum and maximum shared by all arrays (e.g. voxel values of two conditions) in a single pass
+    over each array, chunk by chunk, so that memory-mapped arrays are not loaded as a whole. NaN values (e.g. outside
+    the head) are ignored. Arrays with infinite values or without any values other than NaN are rejected.
+
+    Parameters
+    ----------
+    arrays : list of numpy.ndarray
+        Arrays (or memmaps) of any shapes.
+    chunk_size : int
+        Number of values of an array reduced at once. Default value is 2 ** 22.
+
+    Returns
+    -------
+    total_min, total_max : float
+        Minimum and maximum across all arrays.
+    """
+    arrays = [np.asarray(array).reshape(-1) for array in arrays]
+    if len(arrays) > 0 and any(array.size > 0 for array in arrays) and isinstance(chunk_size, int) and chunk_size > 0:
+        total_min, total_max = np.nan, np.nan
+        for array in arrays:
+            for start in range(0, array.size, chunk_size):
+                chunk = array[start:start + chunk_size]
+                # fmin and fmax ignore NaN (unlike min and max), without warnings for chunks of NaN only
+                total_min = np.fmin(total_min, np.fmin.reduce(chunk))
+                total_max = np.fmax(total_max, np.fmax.reduce(chunk))
+        if not (np.isfinite(total_min) and np.isfinite(total_max)):
+            raise ValueError("Inappropriate values of the arrays. They should contain finite values other than NaN.")
+        return float(total_min), float(total_max)
+    else:
+        raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                         "docstring.")
+
+
+def shared_rescale(arrays, new_min=0.0, new_max=1.0, in_place=False, dtype=np.float32, chunk_size=2 ** 22):
+    """Linearly rescale all arrays from their shared range (see 'shared_extrema') to range [new_min, new_max], e.g.
+    to normalize voxel values of two conditions with the global minimum and maximum. If all values are equal, they
+    are mapped to 'new_min'. NaN values are ignored in the range and stay NaN.
+
+    Parameters
+    ----------
+    arrays : list of numpy.ndarray
+        Arrays (or memmaps) of any shapes.
+    new_min, new_max : float
+        New range of the values. Default values are 0.0 and 1.0.
+    in_place : bool
+        If True, arrays (which must be writeable, contiguous and of floating data type) are rescaled in place.
+        Otherwise, new arrays are created. Default value is False.
+    dtype : numpy.dtype
+        Data type of the new arrays. Default value is numpy.float32.
+    chunk_size : int
+        Number of values of an array processed at once. Default value is 2 ** 22.
+
+    Returns
+    -------
+    rescaled : list of numpy.ndarray
+        Rescaled arrays (the input arrays themselves if 'in_place' is True).
+    """
+    arrays = [np.asarray(array) for array in arrays]
+    if in_place and not all(array.flags.writeable and np.issubdtype(array.dtype, np.floating) and
+                            (array.flags.c_contiguous or array.flags.f_contiguous) for array in arrays):
+        raise ValueError("Inappropriate arrays to rescale in place. They should be writeable, contiguous and of "
+                         "floating type.")
+    total_min, total_max = shared_extrema(arrays, chunk_size)
+    scale = (new_max - new_min) / (total_max - total_min) if total_max > total_min else 0.0
+
+    rescaled = []
+    for array in arrays:
+        if not (array.flags.c_contiguous or array.flags.f_contiguous):
+            array = np.ascontiguousarray(array)
+        out = array if in_place else np.empty_like(array, dtype=dtype)
+        # Memory order of contiguous arrays, so that neither of them is copied
+        source, target = np.ravel(array, order='K'), np.ravel(out, order='K')
+        for start in range(0, source.size, chunk_size):
+            chunk = target[start:start + chunk_size]
+            np.subtract(source[start:start + chunk_size], total_min, out=chunk, casting='unsafe')
+            chunk *= scale
+            chunk += new_min
+        rescaled.append(out)
+    return rescaled
+
+# FREQUENCY ANALYSIS
+def itpc(k, rayleigh_z=False):
+    """Compute inter-trial phase clustering (ITPC) for a vector of phase angles at one time-frequency point over trials.
+
+    Parameters
+    ----------
+    k : 1D numpy.ndarray
+        Vector of phase angles at one time-frequency point over trials
+    rayleigh_z : boolean
+        If True transform ITPC to ITPC-Z, also known as Rayleigh's Z. If False compute default ITPC.
+
+    Returns
+    -------
+    itpc : float
+        If rayleigh_z was False return default ITPC value between 0.0 and 1.0.
+        If rayleigh_z was True return ITPC-Z value which is > 0.0.
+    """
+    if rayleigh_z:
+        return len(k) * np.abs(np.mean(np.exp(1j * k))) ** 2
+    else:
+        return np.abs(np.mean(np.exp(1j * k)))
+
+
+def _unit_phasors(coefs):
+    """Return complex coefficients divided by their magnitudes (zero coefficients are left as zeros)."""
+    magnitude = np.abs(coefs)
+    magnitude[magnitude == 0] = 1
+    return coefs / magnitude
+
+
+def itpc_grid(data, rayleigh_z=False, wavelets=None, precision='float64', chunk_size=None):
+    """Compute inter-trial phase clustering (ITPC) for the whole time-frequency grid at once, ie. for every
+    frequency and time point over trials (see 'itpc'). Unit phase vectors are summed over trials in chunks of
+    'chunk_size' trials, so the memory depends on the chunk size, not on the number of trials.
+
+    Parameters
+    ----------
+    data : numpy.ndarray
+        Complex time-frequency representation of shape (trials x freqs x times) or phase angles of the same shape.
+        If 'wavelets' are given, real epochs of shape (trials x times), which are convolved with the wavelets first.
+    rayleigh_z : boolean
+        If True transform ITPC to ITPC-Z, also known as Rayleigh's Z. If False compute default ITPC. Default value is
+        False.
+    wavelets : list of 1D numpy.ndarray | 2D numpy.ndarray | None
+        Bank of complex wavelets, one per frequency, e.g. from 'morlet_wavelets'. Wavelets of different lengths are
+        centered and zero-padded to the longest one. Default value is None.
+    precision : str
+        Floating point precision of the computations, 'float64' or 'float32'. Default value is 'float64'.
+    chunk_size : int | None
+        Number of trials processed at once. If None, all trials are processed at once. Default value is None.
+
+    Returns
+    -------
+    itpc : 2D numpy.ndarray
+        ITPC (or ITPC-Z) values of shape (freqs x times).
+    """
+    if not (isinstance(data, np.ndarray) and precision in ['float64', 'float32']
+            and (data.ndim == 3 or (data.ndim == 2 and wavelets is not None))
+            and (chunk_size is None or (isinstance(chunk_size, int) and chunk_size >= 1))):
+        raise ValueError(
+            "Inappropriate type, shape or value of one of the arguments. Please read carefully function docstring.")
+
+    complex_dtype = np.complex128 if precision == 'float64' else np.complex64
+    n_trials = data.shape[0]
+    if chunk_size is None:
+        chunk_size = n_trials
+
+    if wavelets is not None:
+        wavelets = pad_wavelets(wavelets)
+        n_fft = scifft.next_fast_len(data.shape[-1] + wavelets.shape[-1] - 1)
+        wavelets_fft = np.fft.fft(wavelets.astype(complex_dtype), n=n_fft, axis=-1)
+        phase_sum = np.zeros((wavelets.shape[0], data.shape[-1]), dtype=complex_dtype)
+        for _, _, i, coefs in _wavelet_convolutions(data, wavelets_fft, wavelets.shape[-1], chunk_size=chunk_size,
+                                                     precision=precision):
+            phase_sum[i] += _unit_phasors(coefs).sum(axis=0)
+        return _itpc_from_sum(phase_sum, n_trials, rayleigh_z)
+
+    phase_sum = None
+    for first in range(0, n_trials, chunk_size):
+        chunk = data[first:first + chunk_size]
+        if np.iscomplexobj(chunk):
+            chunk_sum = _unit_phasors(chunk.astype(complex_dtype, copy=False)).sum(axis=0)
+        else:
+            chunk_sum = np.exp(1j * chunk.astype(precision, copy=False)).sum(axis=0)
+        phase_sum = chunk_sum if phase_sum is None else phase_sum + chunk_sum
+    return _itpc_from_sum(phase_sum, n_trials, rayleigh_z)
+
+
+def _itpc_from_sum(phase_sum, n_trials, rayleigh_z=False):
+    """Return ITPC (or ITPC-Z) from the sum of unit phase vectors over 'n_trials' trials."""
+    itpc_values = np.abs(phase_sum) / n_trials
+    if rayleigh_z:
+        return n_trials * itpc_values ** 2
+    else:
+        return itpc_values
+
+
+def _wavelet_convolutions(epochs, wavelets_fft, wavelet_size, decim=1, chunk_size=None, precision='float64'):
+    """Convolve epochs of shape (epochs x ... x samples) with a bank of wavelets given by FFT of the wavelets
+    centered and zero-padded to 'wavelet_size' ('pad_wavelets'), of length of the fast FFT size of the full
+    convolution. Each chunk of 'chunk_size' epochs is transformed once and multiplied by the spectrum of each wavelet.
+    Yields (first, last, i, coefs), ie. complex coefficients of epochs[first:last] for the i-th wavelet, of shape
+    (last - first x ... x times), where times are the samples of the epochs ('same' mode) decimated by 'decim'.
+    """
+    n_epochs, n_samples = epochs.shape[0], epochs.shape[-1]
+    # Samples of the full convolution corresponding to the samples of epochs ('same' mode), decimated.
+    start = (wavelet_size - 1) // 2
+    times = slice(start, start + n_samples, decim)
+    if chunk_size is None:
+        chunk_size = n_epochs
+    for first in range(0, n_epochs, chunk_size):
+        last = min(first + chunk_size, n_epochs)
+        epochs_fft = np.fft.fft(epochs[first:last].astype(precision, copy=False), n=wavelets_fft.shape[-1], axis=-1)
+        for i in range(wavelets_fft.shape[0]):
+            yield first, last, i, np.fft.ifft(epochs_fft * wavelets_fft[i], axis=-1)[..., times]
+
+
+def morlet_wavelets(sf, freqs, n_cycles=7.0):
+    """Create (cached) bank of complex Morlet wavelets, ie. complex sinusoids tapered by Gaussian of standard
+    deviation n_cycles / (2 * pi * freq), spanning +/- 5 standard deviations. Wavelets are normalized, so that
+    convolution with sinusoid of amplitude A gives complex signal of amplitude A at the wavelet frequency.
+
+    Parameters
+    ----------
+    sf : float
+        Sampling frequency. Must be > 0.
+    freqs : float | 1D array-like of float
+        Frequencies of the wavelets in Hz. Must be > 0.
+    n_cycles : float | 1D array-like of float
+        Number of cycles of each wavelet (single value or one per frequency). Default value is 7.0.
+
+    Returns
+    -------
+    wavelets : list of 1D numpy.ndarray
+        Read-only complex wavelets, one per frequency.
+    """
+    freqs = tuple(float(f) for f in np.atleast_1d(freqs))
+    n_cycles = tuple(float(n) for n in np.broadcast_to(n_cycles, (len(freqs),)))
+    if sf > 0 and min(freqs) > 0 and min(n_cycles) > 0:
+        return _morlet_wavelets(float(sf), freqs, n_cycles)
+    else:
+        raise ValueError(
+            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+
+
+@functools.lru_cache(maxsize=16)
+def _morlet_wavelets(sf, freqs, n_cycles):
+    wavelets = []
+    for freq, cycles in zip(freqs, n_cycles):
+        sigma = cycles / (2 * np.pi * freq)
+        half = int(np.ceil(5 * sigma * sf))
+        t = np.arange(-half, half + 1) / sf
+        wavelet = np.exp(2j * np.pi * freq * t) * np.exp(-t ** 2 / (2 * sigma ** 2))
+        wavelet /= np.sum(np.abs(wavelet)) / 2
+        wavelet.setflags(write=False)
+        wavelets.append(wavelet)
+    return wavelets
+
+
+@functools.lru_cache(maxsize=16)
+def _morlet_wavelets_fft(sf, freqs, n_cycles, n_fft):
+    spectra = np.fft.fft(pad_wavelets(_morlet_wavelets(sf, freqs, n_cycles)), n=n_fft, axis=-1)
+    spectra.setflags(write=False)
+    return spectra
+
+
+def morlet_transform(epochs, sf, freqs, n_cycles=7.0, output='power', decim=1, chunk_size=None):
+    """Compute Morlet wavelet time-frequency transform of epochs. Convolution is performed with FFT, with signals
+    zero-padded to the fast FFT size, and FFT of the wavelet bank is cached per ('sf', 'freqs', 'n_cycles', size).
+    Epochs are processed in chunks of 'chunk_size' epochs and frequencies one by one (by the same engine as
+    'itpc_grid' with wavelets), so only the requested output is stored, e.g. average power and ITPC are accumulated
+    without storing the complex transform.
 
     Parameters
     ----------
-    duration : float
-        Duration of the signal in seconds. Must be > 0.
-    sf : int
-        Sampling frequency of the pulse (number of samples per second). Must be > 0.
-    freq : float
-        Frequency of the signal in Hz.
-    amp : float
-        Amplitude of the pulse in microampers (uA). Must be > 0.
-    s_type : str
-        Type of the wave used in the signal creation. Available types: 'sawtooth', sinusoidal', 'square'.
-        Default value is 'sinusoidal'.
-    first_peak : str
-        Polarity of the first pulse hillock. Available options: 'positive', 'negative'. Default value is 'positive'.
+    epochs : numpy.ndarray
+        Real signal of shape (epochs x channels x samples).
+    sf : float
+        Sampling frequency. Must be > 0.
+    freqs : float | 1D array-like of float
+        Frequencies of the transform in Hz.
+    n_cycles : float | 1D array-like of float
+        Number of cycles of each wavelet (single value or one per frequency). Default value is 7.0.
+    output : str
+        Output of the transform. Available options: 'complex', 'power', 'phase' (of shape
+        (epochs x channels x freqs x times)), 'avg_power', 'itpc' (of shape (channels x freqs x times)),
+        'avg_power_itpc' (both of them). Default value is 'power'.
+    decim : int
+        Decimation factor of the output along time, ie. only every 'decim'-th sample is kept. Default value is 1.
+    chunk_size : int | None
+        Number of epochs processed at once. If None, all epochs are processed at once. Default value is None.
 
     Returns
     -------
-    sig : 1D numpy.ndarray
-        Created one-dimensional alternating signal.
+    tfr : numpy.ndarray | tuple of numpy.ndarray
+        Time-frequency representation. For 'avg_power_itpc', tuple of average power and ITPC.
     """
-    if (isinstance(duration, float) and duration > 0 and isinstance(sf, int) and sf > 0 and isinstance(freq, float)
-            and freq > 0 and isinstance(amp, float) and amp > 0 and s_type in ['sawtooth', 'sinusoidal', 'square']
-            and first_peak in ['positive', 'negative'] and duration * sf >= 1):
+    if not (isinstance(epochs, np.ndarray) and epochs.ndim == 3
+            and output in ['complex', 'power', 'phase', 'avg_power', 'itpc', 'avg_power_itpc']
+            and isinstance(decim, int) and decim >= 1
+            and (chunk_size is None or (isinstance(chunk_size, int) and chunk_size >= 1))):
+        raise ValueError(
+            "Inappropriate type, shape or value of one of the arguments. Please read carefully function docstring.")
 
-        temp_sig = []
-        pulse_time_in_s = 1.0 / freq
-        n_pulses = int(math.ceil(duration / pulse_time_in_s))
-        if s_type == 'sawtooth':
-            for i in np.arange(n_pulses):
-                pulse = create_sawtooth_pulse(freq, sf, amp, first_peak=first_peak)
-                temp_sig.append(pulse)
-        elif s_type == 'sinusoidal':
-            for i in np.arange(n_pulses):
-                pulse = create_sin_pulse(freq, sf, amp, first_peak=first_peak)
-                temp_sig.append(pulse)
+    wavelets = morlet_wavelets(sf, freqs, n_cycles)
+    n_epochs, n_channels, n_samples = epochs.shape
+    wavelet_size = max(len(wavelet) for wavelet in wavelets)
+    n_fft = scifft.next_fast_len(n_samples + wavelet_size - 1)
+    freqs = tuple(float(f) for f in np.atleast_1d(freqs))
+    n_cycles = tuple(float(n) for n in np.broadcast_to(n_cycles, (len(freqs),)))
+    wavelets_fft = _morlet_wavelets_fft(float(sf), freqs, n_cycles, n_fft)
+
+    shape = (n_channels, len(freqs), len(range(0, n_samples, decim)))
+    if output in ['complex', 'power', 'phase']:
+        tfr = np.empty((n_epochs,) + shape, dtype=complex if output == 'complex' else float)
+    else:
+        power_sum = np.zeros(shape)
+        phase_sum = np.zeros(shape, dtype=complex)
+
+    for first, last, i, coefs in _wavelet_convolutions(epochs, wavelets_fft, wavelet_size, decim=decim,
+                                                       chunk_size=chunk_size):
+        if output == 'complex':
+            tfr[first:last, :, i] = coefs
+        elif output == 'power':
+            tfr[first:last, :, i] = coefs.real ** 2 + coefs.imag ** 2
+        elif output == 'phase':
+            tfr[first:last, :, i] = np.angle(coefs)
         else:
-            for i in np.arange(n_pulses):
-                pulse = create_square_pulse(freq, sf, amp, first_peak=first_peak)
-                temp_sig.append(pulse)
-        temp_sig = np.asarray(temp_sig).reshape(-1)
-
-        sig = np.zeros(int(np.around(duration * sf, decimals=0)))
-        sig = temp_sig[:sig.size]
-
-        return sig
+            power_sum[:, i] += (coefs.real ** 2 + coefs.imag ** 2).sum(axis=0)
+            phase_sum[:, i] += _unit_phasors(coefs).sum(axis=0)
+
+    if output in ['complex', 'power', 'phase']:
+        return tfr
+    avg_power = power_sum / n_epochs
+    itpc_values = _itpc_from_sum(phase_sum, n_epochs)
+    if output == 'avg_power':
+        return avg_power
+    elif output == 'itpc':
+        return itpc_values
     else:
-        raise ValueError(
-            "Inappropriate type or value of one of the arguments. Please read carefully function docstring.")
+        return avg_power, itpc_values
 
-# def create_random_noise_signal(duration, sf, min_freq, max_freq, )
 
-# SIMPLE CALCULATIONS
-def z_score(x, avg, sd):
-    """Calculate z-score.
+def pad_wavelets(wavelets):
+    """Center and zero-pad wavelets of different lengths to the length of the longest one.
 
     Parameters
     ----------
-    x : float
-        Standardized variable..
-    avg : float
-        Average from population.
-    sd : float
-        Standard deviation from population.
+    wavelets : list of 1D numpy.ndarray | 2D numpy.ndarray
+        Bank of wavelets.
 
     Returns
     -------
-    z : float
-        Z-score.
+    padded : 2D numpy.ndarray
+        Wavelets of shape (n_wavelets x max_length).
     """
-    return (x - avg) / sd
+    if isinstance(wavelets, np.ndarray) and wavelets.ndim == 2:
+        return wavelets
+    length = max(len(wavelet) for wavelet in wavelets)
+    padded = np.zeros((len(wavelets), length), dtype=np.result_type(*wavelets))
+    for i, wavelet in enumerate(wavelets):
+        start = (length - len(wavelet)) // 2
+        padded[i, start:start + len(wavelet)] = wavelet
+    return padded
 
 
-def create_time_scale(n_samples, sf, unit='s'):
-    """Create one-dimensional time scale.
+# DISTRIBUTION COMPARISON
+def ecdf(values, max_points=None):
+    """Calculate empirical cumulative distribution function (ECDF) of the values, ready to plot as a step curve,
+    e.g. plt.step(x, y, where='post'). It replaces cumulative KDE plots, which evaluate a kernel over every value.
 
     Parameters
     ----------
-    n_samples : int
-        Total number of samples in the signal for which time scale has to be created.
-    sf : int
-        Sampling frequency of the signal, ie. number of samples per second.
-    unit : str
-        Time unit in which time scale has to be expressed. Available units: hours 'h', minutes 'min', seconds 's',
-        milliseconds 'ms', microseconds 'us', nanoseconds 'ns'. Default value is 's'.
+    values : numpy.ndarray | EcdfHistogram
+        Values (of any shape) or histogram of the values.
+    max_points : int | None
+        Maximal number of points of the curve. If given, the curve is thinned to points evenly spaced in the number
+        of values (its last point is always kept). Default value is None.
 
     Returns
     -------
-    time_scale : 1D np.ndarray
-        One-dimensional time scale with values expressed in a specific time unit.
+    x : 1D numpy.ndarray
+        Sorted unique values (or right edges of the histogram bins).
+    y : 1D numpy.ndarray
+        Fraction of the values lower than or equal to x.
     """
-    if (isinstance(n_samples, int) and isinstance(sf, int) and unit in ['h', 'min', 's', 'ms', 'us', 'ns']):
-        unit_convertion = {'h': 3600, 'min': 60, 's': 1, 'ms': 0.001, 'us': 0.000001, 'ns': 0.000000001}
-        total_time_in_unit = (n_samples / sf) / unit_convertion[unit]
-        dt = (1 / sf) / unit_convertion[unit]
-        time_scale = np.arange(0, total_time_in_unit, dt)
-        return time_scale
+    if isinstance(values, EcdfHistogram):
+        x, y = values.edges[1:], np.cumsum(values.counts) / max(values.n, 1)
+    elif isinstance(values, np.ndarray) and values.size > 0:
+        x, counts = np.unique(values, return_counts=True)
+        y = np.cumsum(counts) / values.size
     else:
-        raise ValueError(
-            "Innapriopriate type or value of one of the arguments. Please read carefully function docstring.")
+        raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                         "docstring.")
+    if max_points is not None and len(x) > max_points > 1:
+        keep = np.unique(np.searchsorted(y, np.linspace(0, 1, max_points), side='left').clip(0, len(x) - 1))
+        x, y = x[keep], y[keep]
+    return x, y
 
 
-def list_is_int(list_of_ints):
-    """Check whether given list contains only int values.
+def ks_two_sample(a, b, assume_sorted=False):
+    """Two-sample Kolmogorov-Smirnov test, comparing the entire distribution functions of two datasets (e.g.
+    voxel values of the same ROI in two stimulation configurations). D statistic is exact for value arrays (sorting,
+    O(n log n)) and approximated on the bin edges for histograms (O(bins)); for values quantized to the bins (e.g.
+    uint8 pixel values with one bin per level) the approximation is exact.
 
     Parameters
     ----------
-    list_of_ints : list
-        List of presumably only int values.
+    a, b : numpy.ndarray | EcdfHistogram
+        Values (of any shape) or histograms of the values with identical bins.
+    assume_sorted : bool
+        If True, value arrays are assumed to be one-dimensional and sorted in ascending order. Default value is
+        False.
 
     Returns
     -------
-    verdict : boolean
-        Return True, if 'list_of_ints" contains only in values. Otherwise, return False.
+    statistic : float
+        KS statistic D, the maximal distance between the ECDFs.
+    p_value : float
+        Two-sided p-value, exact for value arrays of up to 10000 values and from Smirnov's asymptotic distribution
+        otherwise (as in scipy.stats.ks_2samp).
     """
-    if (isinstance(list_of_ints, list) and len(list_of_ints) > 0):
-        for item in list_of_ints:
-            if not isinstance(item, int):
-                return False
-        return True
+    if isinstance(a, EcdfHistogram) and isinstance(b, EcdfHistogram) and np.array_equal(a.edges, b.edges):
+        n_a, n_b = a.n, b.n
+        statistic = np.max(np.abs(np.cumsum(a.counts) / n_a - np.cumsum(b.counts) / n_b))
+    elif isinstance(a, np.ndarray) and isinstance(b, np.ndarray) and a.size > 0 and b.size > 0:
+        if not assume_sorted:
+            a, b = np.sort(a, axis=None), np.sort(b, axis=None)
+        n_a, n_b = a.size, b.size
+        pooled = np.concatenate([a, b])
+        cdf_a = np.searchsorted(a, pooled, side='right') / n_a
+        cdf_b = np.searchsorted(b, pooled, side='right') / n_b
+        statistic = np.max(np.abs(cdf_a - cdf_b))
+        if max(n_a, n_b) <= 10000:
+            return float(statistic), float(ks_2samp(a, b).pvalue)
     else:
-        raise ValueError("Inappropriate type or size of the argument.")
+        raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                         "docstring.")
+    m, n = sorted([float(n_a), float(n_b)], reverse=True)
+    p_value = np.clip(kstwo.sf(statistic, np.round(m * n / (m + n))), 0, 1)
+    return float(statistic), float(p_value)
 
 
-def ndarray_contains_only(ndarray, values):
-    """Check whether numpy.ndarray contains only some specific values.
+class EcdfHistogram:
+    """Fixed-resolution histogram of values accumulated chunk by chunk (e.g. from memory-mapped volumes or many
+    images), so that ECDFs and KS statistics of arbitrarily large populations are calculated in O(n) time and O(bins)
+    memory. Histograms with identical bins can be merged.
+
+    Example of the ECDF of two volumes processed in slabs:
+    > hist = EcdfHistogram(bins=4096, range=(0.0, 1.0))
+    > for volume in [volume1, volume2]:
+    >     for start in range(0, volume.shape[0], 16):
+    >         hist.update(volume[start:start + 16])
+    > x, y = ecdf(hist)
 
     Parameters
     ----------
-    ndarray : numpy.ndarray
-        One-dimensional array.
-    values : 1D numpy.ndarray
-        One-dimensional array with values to check whether they occur in 'ndarray'.
+    bins : int
+        Number of equal-width bins. Default value is 1024.
+    range : tuple of float
+        Lower and upper edge of the bins. Values outside the range are counted in the first or the last bin. Default
+        value is (0.0, 1.0).
+    """
+
+    def __init__(self, bins=1024, range=(0.0, 1.0)):
+        if isinstance(bins, int) and bins > 0 and len(range) == 2 and range[0] < range[1]:
+            self.edges = np.linspace(range[0], range[1], bins + 1)
+            self.counts = np.zeros(bins, dtype=np.int64)
+        else:
+            raise ValueError(
+                "Inappropriate type or value of one of the arguments. Please read carefully class docstring.")
+
+    @property
+    def n(self):
+        """Number of accumulated values."""
+        return int(self.counts.sum())
+
+    def update(self, values):
+        """Accumulate the values (of any shape) in the histogram. Non-finite values (NaN, e.g. outside the head
+        in field volumes, and infinities) are skipped, so they are not counted in 'n'.
+
+        Parameters
+        ----------
+        values : numpy.ndarray
+            Values to accumulate.
+
+        Returns
+        -------
+        self : EcdfHistogram
+            Updated histogram.
+        """
+        bins = len(self.counts)
+        lo, hi = self.edges[0], self.edges[-1]
+        # New array, so that the values (e.g. a slab of a memory-mapped volume) are not modified.
+        indices = np.subtract(np.ravel(values), lo, dtype=np.float64)
+        finite = np.isfinite(indices)
+        if not finite.all():
+            indices = indices[finite]
+        indices *= bins / (hi - lo)
+        np.clip(indices, 0, bins - 1, out=indices)
+        self.counts += np.bincount(indices.astype(np.intp), minlength=bins)
+        return self
+
+    def merge(self, other):
+        """Add counts of the other histogram with identical bins.
+
+        Parameters
+        ----------
+        other : EcdfHistogram
+            Histogram to merge.
+
+        Returns
+        -------
+        self : EcdfHistogram
+            Updated histogram.
+        """
+        if isinstance(other, EcdfHistogram) and np.array_equal(self.edges, other.edges):
+            self.counts += other.counts
+            return self
+        else:
+            raise ValueError("Inappropriate histogram to merge. It should have identical bins.")
+
+    def __repr__(self):
+        return "EcdfHistogram(bins={}, range=({}, {}), n={})".format(len(self.counts), self.edges[0],
+                                                                     self.edges[-1], self.n)
+
+
+# VOLUMES
+def content_hashes(paths, index_path):
+    """Return SHA-1 hashes of the contents of the files. Hashes are remembered in the JSON index file together with
+    the size and modification time of the files, so that unchanged files are not hashed again.
+
+    Parameters
+    ----------
+    paths : list of str
+        Paths to the files.
+    index_path : str
+        Path to the JSON index file (created if it does not exist).
 
     Returns
     -------
-    verdict : boolean
-        Return True, if 'ndarray' contains only 'values'. Otherwise, return False.
+    digests : list of str
+        Hexadecimal SHA-1 hashes of the file contents.
+    """
+    try:
+        with open(index_path) as file:
+            index = json.load(file)
+    except (OSError, ValueError):
+        index = {}
+
+    digests, updated = [], False
+    for path in paths:
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = index.get(key)
+        if entry is None or entry[:2] != [stat.st_size, stat.st_mtime_ns]:
+            sha = hashlib.sha1()
+            with open(path, 'rb') as file:
+                for chunk in iter(functools.partial(file.read, 2 ** 24), b''):
+                    sha.update(chunk)
+            index[key] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+            updated = True
+        digests.append(index[key][2])
+
+    if updated:
+        tmp_path = '{}.{}.tmp'.format(index_path, os.getpid())
+        with open(tmp_path, 'w') as file:
+            json.dump(index, file)
+        os.replace(tmp_path, index_path)
+    return digests
+
+
+class VolumeStore:
+    """Store of NIfTI volumes. Each gzipped volume ('.nii.gz') is decompressed only once into an uncompressed '.nii'
+    cache file named after the SHA-1 hash of its content, so that identical volumes share one cache file and
+    a volume changed on disk is decompressed again. Volumes are returned as native-dtype numpy.memmap views of the
+    cache files, so only the voxels which are actually used are read from disk. Content hashes are remembered in the
+    cache index together with the size and modification time of the source file, so that unchanged volumes are not
+    hashed again.
+
+    Example of loading the ROI and electric field volumes:
+    > store = VolumeStore()
+    > data_roi = np.squeeze(store.load('data/ief/eb_on_rotb_roi.nii.gz'))
+    > data_roi[data_roi == 4] = 3  # Copy-on-write, the cache file stays untouched
+    > data_cond1 = store.load('data/ief/periorbital/cec_gm_wm_eb_magnE.nii.gz')
+    > affine = store.image('data/ief/periorbital/cec_gm_wm_eb_magnE.nii.gz').affine
 
+    Parameters
+    ----------
+    cache_dir : str | None
+        Directory of the cache files. If None, 'NENCKI_VOLUME_CACHE' environment variable is used or, if it is not set,
+        '~/.cache/nencki_phd/volumes'. Default value is None.
     """
-    if (isinstance(ndarray, np.ndarray) and ndarray.ndim == 1 and isinstance(values, np.ndarray) and values.ndim == 1):
-        mask = np.isin(ndarray, values)
-        matches = np.sum(mask)
-        if matches != ndarray.size:
-            return False
+
+    def __init__(self, cache_dir=None):
+        if cache_dir is None:
+            cache_dir = os.environ.get('NENCKI_VOLUME_CACHE',
+                                       os.path.join(os.path.expanduser('~'), '.cache', 'nencki_phd', 'volumes'))
+        if isinstance(cache_dir, str):
+            os.makedirs(cache_dir, exist_ok=True)
+            self.cache_dir = cache_dir
+            self._index_path = os.path.join(cache_dir, 'index.json')
         else:
-            return True
+            raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                             "docstring.")
+
+    def cache_path(self, path):
+        """Return path of the uncompressed volume, decompressing the gzipped volume into the cache if needed.
+
+        Parameters
+        ----------
+        path : str
+            Path to the NIfTI volume ('.nii' or '.nii.gz').
+
+        Returns
+        -------
+        cache_path : str
+            Path to the cache file for gzipped volumes or 'path' itself for uncompressed ones.
+        """
+        if not (isinstance(path, str) and os.path.isfile(path)):
+            raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                             "docstring.")
+        with open(path, 'rb') as file:
+            if file.read(2) != b'\x1f\x8b':
+                return path
+
+        digest = self.content_hash(path)
+        cache_path = os.path.join(self.cache_dir, digest + '.nii')
+        if not os.path.isfile(cache_path):
+            tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+            with gzip.open(path, 'rb') as source, open(tmp_path, 'wb') as target:
+                shutil.copyfileobj(source, target, 2 ** 24)
+            os.replace(tmp_path, cache_path)
+        return cache_path
+
+    def image(self, path, mode='c'):
+        """Return NIfTI image (header and affine) with the memory-mapped data of the cached volume.
+
+        Parameters
+        ----------
+        path : str
+            Path to the NIfTI volume ('.nii' or '.nii.gz').
+        mode : str
+            Memory map mode: 'r' (read-only) or 'c' (copy-on-write, changes are kept in memory only). Default value
+            is 'c'.
+
+        Returns
+        -------
+        img : nibabel.Nifti1Image
+            Image with the memory-mapped data.
+        """
+        import nibabel as nib
+
+        if mode in ['r', 'c']:
+            return nib.load(self.cache_path(path), mmap=mode)
+        else:
+            raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                             "docstring.")
+
+    def load(self, path, mode='c'):
+        """Return data of the cached volume in its native data type.
+
+        Parameters
+        ----------
+        path : str
+            Path to the NIfTI volume ('.nii' or '.nii.gz').
+        mode : str
+            Memory map mode: 'r' (read-only) or 'c' (copy-on-write, changes are kept in memory only). Default value
+            is 'c'.
+
+        Returns
+        -------
+        data : numpy.memmap
+            Memory-mapped data of the volume. Volumes with scaling defined in the header ('scl_slope', 'scl_inter')
+            are returned as scaled numpy.ndarray instead.
+        """
+        return np.asanyarray(self.image(path, mode).dataobj)
+
+    def content_hash(self, path):
+        """Return SHA-1 hash of the content of the file, remembered in the cache index together with the size and
+        modification time of the file.
+
+        Parameters
+        ----------
+        path : str
+            Path to the file.
+
+        Returns
+        -------
+        digest : str
+            Hexadecimal SHA-1 hash of the file content.
+        """
+        return content_hashes([path], self._index_path)[0]
+
+
+def roi_statistics(labels, volumes, names=None, percentiles=None, ddof=0, chunk_size=2**16):
+    """Calculate count, mean, SD, min, max and percentiles of the values of field volumes within each ROI label.
+    Voxels are processed in chunks in a single pass over each field volume: non-negative integer labels are used
+    directly as bins of numpy.bincount (count, mean and SD, combined across chunks as in Chan et al.) and of
+    numpy.minimum.at and numpy.maximum.at (min and max), so that neither per-label boolean masks nor full float64
+    copies of the volumes are created. Voxels are grouped by label (sorted) only if percentiles are requested.
+
+    Parameters
+    ----------
+    labels : numpy.ndarray
+        Volume of integer ROI labels (e.g. 0: Background, 1: Eyeballs, 2: Optic Nerves, 4: Rest of the Brain).
+        Singleton dimensions are ignored.
+    volumes : numpy.ndarray | list of numpy.ndarray
+        Field volume or list of field volumes (e.g. magnE, magnJ) of the same shape as 'labels' (singleton dimensions
+        are ignored). Values must not be NaN.
+    names : list of str | None
+        Names of the field volumes used in the 'volume' column. If None, indices of the volumes are used. Default
+        value is None.
+    percentiles : list of float | None
+        Percentiles (0-100) calculated per label with linear interpolation (as in numpy.percentile). Default value
+        is None.
+    ddof : int
+        Delta degrees of freedom of the SD. Default value is 0.
+    chunk_size : int
+        Number of voxels processed at once (small chunks stay in the CPU cache). Default value is 2**16.
+
+    Returns
+    -------
+    stats : pandas.DataFrame
+        One row per field volume and label with columns 'volume', 'label', 'count', 'mean', 'sd', 'min', 'max' and
+        'p<percentile>' for each of the percentiles.
+    """
+    if isinstance(volumes, np.ndarray):
+        volumes = [volumes]
+    if names is None:
+        names = list(range(len(volumes)))
+    if percentiles is None:
+        percentiles = []
+    labels = np.squeeze(np.asanyarray(labels))
+    if (len(volumes) > 0 and len(names) == len(volumes) and
+            all(np.shape(np.squeeze(volume)) == labels.shape for volume in volumes) and
+            labels.size > 0 and (labels.dtype.kind in 'biu' or np.all(np.mod(labels, 1) == 0)) and
+            all(0 <= q <= 100 for q in percentiles) and
+            isinstance(ddof, int) and ddof >= 0 and isinstance(chunk_size, int) and chunk_size >= 1):
+        # Ravel everything in the memory order of the labels, so that (memory-mapped) NIfTI volumes are not copied.
+        order = 'F' if labels.flags.f_contiguous and not labels.flags.c_contiguous else 'C'
+        labels = labels.ravel(order=order)
+        values = [np.squeeze(np.asanyarray(volume)).ravel(order=order) for volume in volumes]
+
+        # Non-negative labels of moderate range are bins themselves, other labels are replaced with their ranks.
+        low, high = labels.min(), labels.max()
+        if low >= 0 and high < max(2**16, labels.size):
+            codes = labels.astype(np.intp, copy=False)
+            n_bins = int(high) + 1
+            label_values = None
+        else:
+            label_values, codes = np.unique(labels, return_inverse=True)
+            codes = codes.ravel()
+            n_bins = len(label_values)
+
+        counts = np.zeros(n_bins, dtype=np.int64)
+        means = np.zeros((len(values), n_bins))
+        squares = np.zeros((len(values), n_bins))
+        mins = np.full((len(values), n_bins), np.inf)
+        maxs = np.full((len(values), n_bins), -np.inf)
+        for first in range(0, labels.size, chunk_size):
+            chunk_codes = codes[first:first + chunk_size]
+            chunk_counts = np.bincount(chunk_codes, minlength=n_bins)
+            total = counts + chunk_counts
+            present = chunk_counts > 0
+            for i, volume_values in enumerate(values):
+                chunk = np.asarray(volume_values[first:first + chunk_size], dtype=np.float64)
+                chunk_means = np.divide(np.bincount(chunk_codes, weights=chunk, minlength=n_bins), chunk_counts,
+                                        out=np.zeros(n_bins), where=present)
+                deviations = chunk - chunk_means[chunk_codes]
+                deviations *= deviations
+                # Parallel update of means and sums of squared deviations (Chan, Golub and LeVeque, 1979).
+                delta = chunk_means - means[i]
+                weights = np.divide(chunk_counts, total, out=np.zeros(n_bins), where=present)
+                squares[i] += np.bincount(chunk_codes, weights=deviations, minlength=n_bins)
+                squares[i] += delta * delta * counts * weights
+                means[i] += delta * weights
+                np.minimum.at(mins[i], chunk_codes, chunk)
+                np.maximum.at(maxs[i], chunk_codes, chunk)
+            counts = total
+
+        present = np.flatnonzero(counts)
+        if label_values is None:
+            label_values = present
+        else:
+            label_values = label_values[present]
+        counts = counts[present]
+        if len(percentiles) > 0:
+            # Voxels are grouped by label once; only labels present in the volume are sorted (partitioned).
+            grouping = np.argsort(codes.astype(np.min_scalar_type(n_bins - 1)), kind='stable')
+            bounds = np.concatenate(([0], np.cumsum(counts)))
+
+        tables = []
+        for i, name in enumerate(names):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                sd = np.sqrt(squares[i, present] / (counts - ddof))
+            table = {'volume': name, 'label': label_values.astype(np.int64), 'count': counts,
+                     'mean': means[i, present], 'sd': sd, 'min': mins[i, present], 'max': maxs[i, present]}
+            if len(percentiles) > 0:
+                grouped = values[i][grouping]
+                label_percentiles = np.array([np.percentile(np.asarray(grouped[bounds[j]:bounds[j + 1]],
+                                                                       dtype=np.float64), percentiles)
+                                              for j in range(len(present))])
+                for k, q in enumerate(percentiles):
+                    table['p{:g}'.format(q)] = label_percentiles[:, k]
+            tables.append(pd.DataFrame(table))
+        return pd.concat(tables, ignore_index=True)
     else:
-        raise ValueError("Inappropriate type or shape of the argument.")
+        raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                         "docstring.")
 
 
-def twodim_to_onedim_list(twodim_list):
-    return list(chain.from_iterable(twodim_list))
+class RoiIndex:
+    """Sorted flat voxel indices of each label of a ROI volume. The index is computed once, so that values of any
+    number of field volumes within the ROIs are extracted with numpy.take on the raveled (memory-mapped) volumes,
+    without creating full-volume boolean masks. Flat indices follow the memory order of the ROI volume ('F' for NIfTI
+    volumes), so raveling field volumes stored in the same order does not copy them.
 
+    Example of extracting values of both configurations for the Rest of the Brain ROI (labels 3 and 4):
+    > store = VolumeStore()
+    > roi_index = RoiIndex.for_volume('data/ief/eb_on_rotb_roi.nii.gz', store=store)
+    > values_cond1, values_cond2 = roi_index.take([store.load(path_cond1), store.load(path_cond2)], [3, 4])
 
-# TRANSFORMATIONS AND CORRECTIONS
-def baseline_correction(sig, b_window, c_window, b_type='absolute'):
-    """Perform baseline correction on a given one-dimensional signal.
+    Parameters
+    ----------
+    labels : numpy.ndarray
+        Volume of integer ROI labels. Singleton dimensions are ignored.
+    background : int | None
+        Label which is not indexed (e.g. 0: Background). If None, all labels are indexed. Default value is 0.
+    """
+
+    __slots__ = ('shape', 'order', 'background', 'labels', 'offsets', 'indices', '_source')
+
+    def __init__(self, labels, background=0):
+        labels = np.squeeze(labels)
+        if (isinstance(labels, np.ndarray) and labels.size > 0 and
+                (background is None or isinstance(background, (int, np.integer)))):
+            order = 'F' if labels.flags.f_contiguous and not labels.flags.c_contiguous else 'C'
+            flat = np.ravel(labels, order=order)
+            if background is None:
+                voxels = np.arange(flat.size, dtype=np.int64)
+            else:
+                voxels = np.flatnonzero(flat != background)
+            values = flat[voxels]
+            if not np.all(np.mod(values, 1) == 0):
+                raise ValueError("Inappropriate values of labels. They should be integers.")
+            values = values.astype(np.int64)
+            sort = np.argsort(values, kind='stable')
+            self.labels, starts = np.unique(values[sort], return_index=True)
+            self.offsets = np.append(starts, values.size).astype(np.int64)
+            self.indices = voxels[sort].astype(np.int64)
+            self.shape = labels.shape
+            self.order = order
+            self.background = background
+            self._source = None
+        else:
+            raise ValueError(
+                "Inappropriate type or value of one of the arguments. Please read carefully class docstring.")
+
+    @classmethod
+    def for_volume(cls, path, background=0, store=None):
+        """Return index of the ROI volume, persisted next to it in '<volume name>.roi_index.npz'. The index is
+        computed only when the persisted one is missing or the ROI volume has changed since.
+
+        Parameters
+        ----------
+        path : str
+            Path to the NIfTI ROI volume ('.nii' or '.nii.gz').
+        background : int | None
+            Label which is not indexed. If None, all labels are indexed. Default value is 0.
+        store : VolumeStore | None
+            Store used to load the ROI volume. If None, the default store is used. Default value is None.
+
+        Returns
+        -------
+        roi_index : RoiIndex
+            Index of the ROI volume.
+        """
+        stat = os.stat(path)
+        source = np.array([stat.st_size, stat.st_mtime_ns, -1 if background is None else background], dtype=np.int64)
+        index_path = (path[:-len('.nii.gz')] if path.endswith('.nii.gz') else os.path.splitext(path)[0]) + \
+            '.roi_index.npz'
+        if os.path.isfile(index_path):
+            roi_index = cls.load(index_path)
+            if np.array_equal(roi_index._source, source):
+                return roi_index
+
+        if store is None:
+            store = VolumeStore()
+        roi_index = cls(store.load(path, mode='r'), background=background)
+        roi_index.save(index_path, source=source)
+        return roi_index
+
+    @classmethod
+    def load(cls, path):
+        """Load index saved with 'save'.
+
+        Parameters
+        ----------
+        path : str
+            Path to the '.npz' file.
+
+        Returns
+        -------
+        roi_index : RoiIndex
+            Index of the ROI volume.
+        """
+        with np.load(path) as file:
+            roi_index = cls.__new__(cls)
+            roi_index.shape = tuple(int(n) for n in file['shape'])
+            roi_index.order = str(file['order'])
+            roi_index.background = None if int(file['background']) < 0 else int(file['background'])
+            roi_index.labels = file['labels']
+            roi_index.offsets = file['offsets']
+            roi_index.indices = file['indices']
+            roi_index._source = file['source']
+        return roi_index
+
+    def save(self, path, source=None):
+        """Save index to the uncompressed '.npz' file.
+
+        Parameters
+        ----------
+        path : str
+            Path to the '.npz' file.
+        source : 1D numpy.ndarray | None
+            Size, modification time and background label of the ROI volume the index was computed from (used by
+            'for_volume'). Default value is None.
+        """
+        background = -1 if self.background is None else self.background
+        tmp_path = '{}.{}.tmp.npz'.format(path[:-len('.npz')] if path.endswith('.npz') else path, os.getpid())
+        np.savez(tmp_path, shape=np.array(self.shape), order=np.array(self.order), background=np.array(background),
+                 labels=self.labels, offsets=self.offsets, indices=self.indices,
+                 source=np.array([], dtype=np.int64) if source is None else source)
+        os.replace(tmp_path, path)
+
+    def voxels(self, labels):
+        """Return sorted flat indices of the voxels of one or several ROI labels.
+
+        Parameters
+        ----------
+        labels : int | list of int
+            ROI label or labels (e.g. [3, 4] for the Rest of the Brain split into GM and WM).
+
+        Returns
+        -------
+        indices : 1D numpy.ndarray of int64
+            Flat voxel indices in the memory order of the ROI volume ('order'). Labels which are not present in the
+            ROI volume have no voxels.
+        """
+        segments = []
+        for label in np.atleast_1d(labels):
+            position = np.searchsorted(self.labels, label)
+            if position < len(self.labels) and self.labels[position] == label:
+                segments.append(self.indices[self.offsets[position]:self.offsets[position + 1]])
+            elif label == self.background:
+                raise ValueError("Background label {} is not indexed.".format(label))
+        if len(segments) == 0:
+            return np.array([], dtype=np.int64)
+        return segments[0] if len(segments) == 1 else np.sort(np.concatenate(segments))
+
+    def take(self, volumes, labels):
+        """Extract values of field volumes within the ROI.
+
+        Parameters
+        ----------
+        volumes : numpy.ndarray | list of numpy.ndarray
+            Field volume or list of field volumes of the same number of voxels as the ROI volume.
+        labels : int | list of int
+            ROI label or labels.
+
+        Returns
+        -------
+        values : 1D numpy.ndarray | 2D numpy.ndarray
+            Values of the field volume (1D) or field volumes (n_volumes x n_voxels) in the ROI.
+        """
+        single = isinstance(volumes, np.ndarray)
+        if single:
+            volumes = [volumes]
+        if all(np.size(volume) == np.prod(self.shape) for volume in volumes):
+            indices = self.voxels(labels)
+            values = [np.take(np.ravel(np.squeeze(volume), order=self.order), indices) for volume in volumes]
+            return values[0] if single else np.stack(values)
+        else:
+            raise ValueError("Inappropriate size of the volumes. It should be equal to the size of the ROI volume.")
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __repr__(self):
+        return "RoiIndex(shape={}, labels={}, n_voxels={})".format(self.shape, self.labels.tolist(), self.indices.size)
+
+
+def volume_algebra(path_a, path_b, output_path, operation='difference', mask=None, mask_labels=None, slab_size=8,
+                   compresslevel=6, n_jobs=None, store=None):
+    """Calculate voxel-wise difference, ratio or masked difference of two NIfTI volumes (e.g. field volumes of two
+    stimulation configurations) and save it as a new NIfTI volume with the header of the first one. Volumes are
+    processed slab by slab from memory-mapped inputs, so that only a few slabs are kept in memory at once. Slabs
+    are taken along the last axis, which is the slowest varying one in the (Fortran-ordered) NIfTI data, so that
+    every slab is a contiguous part of the input and output files.
 
     Parameters
     ----------
-    sig : 1D numpy.ndarray
-        One-dimensional signal for which baseline correction has to be performed.
-    b_window : list of int of length 2
-        Range of the 'sig' samples from which baseline should be calculated. Minimum and maximum range
-        is [0, sig.size-1].
-    c_window : list of int of length 2
-        Range of the 'sig' samples which should be baseline-corrected. Minimum and maximum range is [0, sig.size-1].
-    b_type : str
-        Type of baseline. Available options: 'absolute', 'relative', 'relchange', 'decibel' (based on
-        http://bjornherrmann.com/baseline_correction.html). Default values is 'absolute'. For 'X' is the signal
-        and for 'B' is the baseline calculated as mean(sig[window[0]:window[1]]):
-        1. 'absolute' - absolute baseline, range of possible values: [-inf, inf], calculated as X - B;
-        2. 'relative' - relative baseline, range of possible values: [0, inf], calculated as X / B;
-        3. 'relchange' - relative change baseline, range of possible values: [-1, inf], calculated as (X - B) / B;
-        4. 'decibel' - decibel baseline (defined only for power), range of possible values: [-inf, inf], calculated as
-        10 * log10(X / B).
+    path_a, path_b : str
+        Paths to the NIfTI volumes ('.nii' or '.nii.gz') of the same shape.
+    output_path : str
+        Path to the output volume. Volumes ending with '.nii.gz' are compressed slab by slab in parallel (as
+        a multi-member gzip file), all other ones are saved uncompressed.
+    operation : str
+        Operation: 'difference' (a - b), 'ratio' (a / b, 0 where b == 0) or 'masked_difference' (a - b within the
+        mask, 0 elsewhere). Default value is 'difference'.
+    mask : str | numpy.ndarray | None
+        Path to the mask (e.g. ROI) volume or the mask volume itself, required for 'masked_difference' and not
+        accepted by other operations. Singleton dimensions are ignored. Default value is None.
+    mask_labels : list of int | None
+        Labels of the mask volume forming the mask (only for 'masked_difference'). If None, all non-zero voxels form
+        the mask. Default value is None.
+    slab_size : int
+        Number of slices in one slab. Default value is 8.
+    compresslevel : int
+        Compression level (1-9) of the '.nii.gz' output. Default value is 6.
+    n_jobs : int | None
+        Number of threads compressing the slabs. If None, number of CPUs is used. Default value is None.
+    store : VolumeStore | None
+        Store used to load the volumes. If None, the default store is used. Default value is None.
 
     Returns
     -------
-    corrected : numpy.ndarray
-        Baseline-corrected signal.
+    output_path : str
+        Path to the output volume. Its data type is the data type of the first volume (float32 for integer
+        volumes).
     """
-    if (isinstance(sig, np.ndarray) and sig.ndim == 1 and isinstance(b_window, list) and list_is_int(b_window)
-            and len(b_window) in range(1, 3) and isinstance(c_window, list) and list_is_int(c_window)
-            and len(c_window) in range(1, 3) and b_type in ['absolute', 'relative', 'relchange', 'decibel']):
+    if store is None:
+        store = VolumeStore()
+    img = store.image(path_a, mode='r')
+    data_a = np.asanyarray(img.dataobj)
+    data_b = store.load(path_b, mode='r')
+    if isinstance(mask, str):
+        mask = store.load(mask, mode='r')
+    if mask is not None:
+        mask = np.squeeze(mask)
+    if not (data_a.shape == data_b.shape and isinstance(output_path, str) and
+            operation in ['difference', 'ratio', 'masked_difference'] and
+            (mask is not None and mask.shape == np.squeeze(data_a).shape if operation == 'masked_difference'
+             else mask is None and mask_labels is None) and
+            isinstance(slab_size, int) and slab_size > 0 and compresslevel in range(1, 10) and
+            (n_jobs is None or (isinstance(n_jobs, int) and n_jobs > 0))):
+        raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                         "docstring.")
+
+    header = img.header.copy()
+    header.set_data_dtype(data_a.dtype if np.issubdtype(data_a.dtype, np.floating) else np.float32)
+    header.set_slope_inter(np.nan, np.nan)
+    header['vox_offset'] = 0
+    dtype = header.get_data_dtype()  # With the byte order of the header
+    with io.BytesIO() as buffer:
+        header.write_to(buffer)
+        buffer.write(b'\x00' * (int(header['vox_offset']) - buffer.tell()))
+        head = buffer.getvalue()
+
+    # Transposed (C-ordered) views, so that slabs along their first axis are contiguous
+    data_a, data_b = np.squeeze(data_a).T, np.squeeze(data_b).T
+    if mask is not None:
+        mask = mask.T
+
+    def slab(start):
+        a = np.asarray(data_a[start:start + slab_size], dtype=np.float64)
+        b = np.asarray(data_b[start:start + slab_size], dtype=np.float64)
+        if operation == 'ratio':
+            result = np.divide(a, b, out=np.zeros_like(a), where=b != 0)
+        else:
+            result = np.subtract(a, b, out=a)
+            if operation == 'masked_difference':
+                m = mask[start:start + slab_size]
+                result[~(m != 0 if mask_labels is None else np.isin(m, mask_labels))] = 0
+        return result.astype(dtype).tobytes()
+
+    starts = range(0, data_a.shape[0], slab_size)
+    tmp_path = '{}.{}.tmp'.format(output_path, os.getpid())
+    with open(tmp_path, 'wb') as file:
+        if output_path.endswith('.gz'):
+            n_jobs = (os.cpu_count() or 1) if n_jobs is None else n_jobs
+
+            def compressed_slab(start):
+                return gzip.compress(slab(start), compresslevel=compresslevel)
+
+            file.write(gzip.compress(head, compresslevel=compresslevel))
+            with ThreadPoolExecutor(n_jobs) as executor:
+                pending = deque()
+                for start in starts:
+                    pending.append(executor.submit(compressed_slab, start))
+                    if len(pending) >= 2 * n_jobs:
+                        file.write(pending.popleft().result())
+                while pending:
+                    file.write(pending.popleft().result())
+        else:
+            file.write(head)
+            for start in starts:
+                file.write(slab(start))
+    os.replace(tmp_path, output_path)
+    return output_path
 
-        baseline = np.mean(sig[b_window[0]:b_window[1]])
 
-        if b_type == 'absolute':
-            sig[c_window[0]:c_window[1]] -= baseline
-        elif b_type == 'relative':
-            sig[c_window[0]:c_window[1]] /= baseline
-        elif b_type == 'relchange':
-            sig[c_window[0]:c_window[1]] = (sig[c_window[0]:c_window[1]] - baseline) / baseline
-        else:
-            sig[c_window[0]:c_window[1]] = 10 * np.log10(sig[c_window[0]:c_window[1]] / baseline)
+class SlabProjections:
+    """Mean, sum and max projections of any contiguous slab of a NIfTI volume along a given axis (e.g. the sagittal
+    slab data[44:75, :, :]). Cumulative sums of the volume along the axis are computed once and cached on disk, so
+    that the sum or mean of any slab is a subtraction of two slices of the memory-mapped cumulative sums. Max
+    projections use a cached sparse table of maxima over slabs of 2^k slices, so that the max of any slab is
+    a maximum of two of its slices. Changing slab bounds does not touch the volume at all. Values must not be NaN.
 
-        return sig
-    else:
-        raise ValueError(
-            "Inappropriate type, value or shape of one of the arguments. Please read carefully function docstring.")
+    Example of the sagittal view of the periorbital configuration:
+    > projections = SlabProjections('data/ief/periorbital/cec_gm_wm_eb_magnE.nii.gz', axis=0)
+    > stacked_slices = projections.mean(44, 75)  # Equal to np.mean(data[44:75, :, :], axis=0)
 
+    Parameters
+    ----------
+    path : str
+        Path to the NIfTI volume ('.nii' or '.nii.gz').
+    axis : int
+        Axis along which the slabs are taken. Default value is 0.
+    store : VolumeStore | None
+        Store used to load the volume and to keep the cache files. If None, the default store is used. Default value
+        is None.
+    """
 
-def hanning_correction(sig, c_window, mode='full'):
-    """Perform Hanning window correction on a given one-dimensional signal.
+    def __init__(self, path, axis=0, store=None):
+        self.store = VolumeStore() if store is None else store
+        self.path = path
+        self._data = np.squeeze(self.store.load(path, mode='r'))
+        if isinstance(axis, int) and -self._data.ndim <= axis < self._data.ndim:
+            self.axis = axis % self._data.ndim
+            self.shape = self._data.shape
+            self._name = os.path.join(self.store.cache_dir, '{}.axis{}'.format(self.store.content_hash(path),
+                                                                                self.axis))
+            self._cumsum = None
+            self._maxima = None
+        else:
+            raise ValueError(
+                "Inappropriate type or value of one of the arguments. Please read carefully class docstring.")
+
+    def sum(self, start, stop):
+        """Return sum of the slices in range [start, stop) along the axis.
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of the slices. Must be 0 <= start < stop <= number of slices.
+
+        Returns
+        -------
+        projection : numpy.ndarray of float64
+            Sum projection of the slab (shape of the volume without the axis).
+        """
+        self._check_range(start, stop)
+        if self._cumsum is None:
+            self._cumsum = self._cached('cumsum', self._write_cumsum)
+        return self._cumsum[stop] - self._cumsum[start]
+
+    def mean(self, start, stop):
+        """Return mean of the slices in range [start, stop) along the axis.
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of the slices. Must be 0 <= start < stop <= number of slices.
+
+        Returns
+        -------
+        projection : numpy.ndarray of float64
+            Mean projection of the slab (shape of the volume without the axis).
+        """
+        projection = self.sum(start, stop)
+        projection /= stop - start
+        return projection
+
+    def max(self, start, stop):
+        """Return maximum of the slices in range [start, stop) along the axis.
+
+        Parameters
+        ----------
+        start, stop : int
+            Range of the slices. Must be 0 <= start < stop <= number of slices.
+
+        Returns
+        -------
+        projection : numpy.ndarray
+            Max projection of the slab (shape of the volume without the axis) in the data type of the volume.
+        """
+        self._check_range(start, stop)
+        if self._maxima is None:
+            self._maxima = self._cached('max', self._write_maxima)
+        level = (stop - start).bit_length() - 1
+        return np.maximum(self._maxima[level, start], self._maxima[level, stop - 2 ** level])
+
+    def _check_range(self, start, stop):
+        if not (isinstance(start, (int, np.integer)) and isinstance(stop, (int, np.integer)) and
+                0 <= start < stop <= self.shape[self.axis]):
+            raise ValueError("Inappropriate slab range. It should be 0 <= start < stop <= number of slices.")
+
+    def _cached(self, kind, write):
+        path = '{}.{}.npy'.format(self._name, kind)
+        if not os.path.isfile(path):
+            tmp_path = '{}.{}.tmp.npy'.format(path[:-len('.npy')], os.getpid())
+            write(tmp_path)
+            os.replace(tmp_path, path)
+        return np.load(path, mmap_mode='r')
+
+    def _slow_axis(self):
+        """Return the slowest varying axis of the volume (the last one of NIfTI volumes), along which its slices are
+        contiguous parts of the memory-mapped file."""
+        return self._data.ndim - 1 if self._data.flags.f_contiguous and not self._data.flags.c_contiguous else 0
+
+    def _blocks(self, block_size=2 ** 20):
+        """Yield indices of blocks of about 'block_size' values taken along the slowest varying axis of the volume,
+        so that each block is a contiguous part of the memory-mapped file and the volume is read only once."""
+        slow_axis = self._slow_axis()
+        step = max(1, block_size * self.shape[slow_axis] // max(self._data.size, 1))
+        for start in range(0, self.shape[slow_axis], step):
+            index = [slice(None)] * self._data.ndim
+            index[slow_axis] = slice(start, start + step)
+            yield tuple(index)
+
+    def _write_cumsum(self, path):
+        n = self.shape[self.axis]
+        slice_shape = self.shape[:self.axis] + self.shape[self.axis + 1:]
+        cumsum = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(n + 1,) + slice_shape)
+        cumsum[0] = 0
+        if self.axis == self._slow_axis():
+            # Slices along the slowest varying axis are contiguous, so they are summed one by one.
+            slices = np.moveaxis(self._data, self.axis, 0)
+            for i in range(n):
+                np.add(cumsum[i], slices[i], out=cumsum[i + 1])
+        else:
+            # View of the cumulative sums (without the leading zeros) with the axes of the volume
+            target = np.moveaxis(cumsum[1:], 0, self.axis)
+            for index in self._blocks():
+                target[index] = np.cumsum(self._data[index], axis=self.axis, dtype=np.float64)
+        cumsum.flush()
+
+    def _write_maxima(self, path):
+        n = self.shape[self.axis]
+        slice_shape = self.shape[:self.axis] + self.shape[self.axis + 1:]
+        maxima = np.lib.format.open_memmap(path, mode='w+', dtype=self._data.dtype,
+                                           shape=(n.bit_length(), n) + slice_shape)
+        target = np.moveaxis(maxima[0], 0, self.axis)
+        for index in self._blocks():
+            target[index] = self._data[index]
+        for level in range(1, n.bit_length()):
+            half = 2 ** (level - 1)
+            for i in range(n - 2 ** level + 1):
+                np.maximum(maxima[level - 1, i], maxima[level - 1, i + half], out=maxima[level, i])
+        maxima.flush()
+
+
+# IMAGES
+def load_gray_images(paths, n_jobs=None):
+    """Decode images (e.g. PNG field maps of the electrodes) to 8-bit grayscale in a thread pool.
 
     Parameters
     ----------
-    sig : 1D numpy.ndarray
-        One-dimensional signal.
-    c_window : list of int of length 2
-        Range of the 'sig' samples which should be Hanning-corrected. Minimum and maximum range is [0, sig.size-1].
-    mode : str
-        Mode of the Hanning correction. There are three available modes: 'half-left', 'half-right', 'full'.
-        Default value is 'full'. Modes description:
-        1. 'half-left' - only half left part of the Hanning window is used for the correction.
-        2. 'half-right' - only half right part of the Hanning window is used for the correction.
-        3. 'full' - full Hanning window is used for the correction.
+    paths : list of str
+        Paths to the images.
+    n_jobs : int | None
+        Number of decoding threads. If None, number of CPUs is used. Default value is None.
 
     Returns
     -------
-    corrected : 1D numpy.ndarray
-        Hanning-corrected signal.
+    images : list of 2D numpy.ndarray of uint8
+        Grayscale images (values 0-255, divide by 255.0 to normalize them to range [0, 1]).
     """
-    if (isinstance(sig, np.ndarray) and sig.ndim == 1 and list_is_int(c_window) and len(c_window) in range(1, 3)
-            and mode in ['half-left', 'half-right', 'full']):
-
-        c_window_size = sig[c_window[0]:c_window[1]].size
-        if mode == 'half-left':
-            hann = np.hanning(c_window_size * 2)[:c_window_size]
-            sig[c_window[0]:c_window[1]] = np.multiply(sig[c_window[0]:c_window[1]], hann)
-        elif mode == 'half-right':
-            hann = np.hanning(c_window_size * 2)[c_window_size:]
-            sig[c_window[0]:c_window[1]] = np.multiply(sig[c_window[0]:c_window[1]], hann)
-        else:
-            hann = np.hanning(c_window_size)
-            sig[c_window[0]:c_window[1]] = np.multiply(sig[c_window[0]:c_window[1]], hann)
-        return sig
+    if isinstance(paths, (list, tuple)) and all(isinstance(path, str) for path in paths) and \
+            (n_jobs is None or (isinstance(n_jobs, int) and n_jobs > 0)):
+        with ThreadPoolExecutor(n_jobs or os.cpu_count() or 1) as executor:
+            return list(executor.map(_decode_gray_image, paths))
     else:
-        raise ValueError(
-            "Inappropriate type, value or shape of one of the arguments. Please read carefully function docstring.")
+        raise ValueError("Inappropriate type or value of one of the arguments. Please read carefully function "
+                         "docstring.")
 
 
-def spectrum(sig, time_scale, abs=True):
-    """Compute the one-dimensional Discrete Fourier Transform (DFT) for given N-dimensional signal.
+def _decode_gray_image(path):
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return np.array(image.convert('L'), dtype=np.uint8)
+
+
+def gray_histograms(paths, cache_dir=None, n_jobs=None):
+    """Calculate 256-bin histograms of the gray levels of images. Histograms are cached on disk, keyed by the content
+    hash of the images (remembered together with their size and modification time), so that each image is decoded
+    only once.
 
     Parameters
     ----------
-    sig : numpy.ndarray
-        Signal for DFT (can be complex).
-    time_scale : 1D numpy.ndarray
-        One-dimensional time scale in seconds.
-    abs : boolean
-        If True, the result of DFT will be absolute, thus converted from complex to real space and contain information only
-         about signal magnitude. If False, the result of DFT will be complex. Default value is True.
+    paths : list of str
+        Paths to the images.
+    cache_dir : str | None
+        Directory of the cached histograms. If None, 'NENCKI_IMAGE_CACHE' environment variable is used or, if it is
+        not set, '~/.cache/nencki_phd/images'. Default value is None.
+    n_jobs : int | None
+        Number of decoding threads. If None, number of CPUs is used. Default value is None.
 
     Returns
     -------
-    freqs : 1D numpy.ndarray
-        One-dimensional array containing information about the signal frequencies.
-    fft : numpy.ndarray or complex numpy.ndarray
-        One-dimensional array containing the result of DFT. If parameter 'abs' is equal to False, the result will
-        be complex numpy.ndarray.
+    counts : 2D numpy.ndarray of int64
+        Number of pixels of each gray level (n_images x 256).
     """
-    # if (isinstance(sig, np.ndarray) and isinstance(time_scale, np.ndarray) and time_scale.ndim == 1):
-    if True:
-        freqs = scifft.fftfreq(sig.size, d=time_scale[1] - time_scale[0])
-        fft = np.fft.fft(sig)
-        if abs:
-            return freqs, np.abs(fft)
+    if cache_dir is None:
+        cache_dir = os.environ.get('NENCKI_IMAGE_CACHE',
+                                   os.path.join(os.path.expanduser('~'), '.cache', 'nencki_phd', 'images'))
+    os.makedirs(cache_dir, exist_ok=True)
+    digests = content_hashes(paths, os.path.join(cache_dir, 'index.json'))
+    cache_paths = [os.path.join(cache_dir, digest + '.hist256.npy') for digest in digests]
+
+    counts = np.zeros((len(paths), 256), dtype=np.int64)
+    missing = []
+    for i, cache_path in enumerate(cache_paths):
+        if os.path.isfile(cache_path):
+            counts[i] = np.load(cache_path)
         else:
-            return freqs, fft
-    else:
-        raise ValueError(
-            "Inappropriate type or shape of one of the arguments. Please read carefully function docstring.")
+            missing.append(i)
+    images = load_gray_images([paths[i] for i in missing], n_jobs=n_jobs)
+    for i, image in zip(missing, images):
+        counts[i] = np.bincount(image.ravel(), minlength=256)
+        tmp_path = '{}.{}.tmp.npy'.format(cache_paths[i][:-len('.npy')], os.getpid())
+        np.save(tmp_path, counts[i])
+        os.replace(tmp_path, cache_paths[i])
+    return counts
 
-def new_range(signal, new_min, new_max):
-    new_signal = (((signal - np.min(signal)) * (new_max - new_min)) / (np.max(signal) - np.min(signal))) + new_min
-    return new_signal
 
-# FREQUENCY ANALYSIS
-def itpc(k, rayleigh_z=False):
-    """Compute inter-trial phase clustering (ITPC) for a vector of phase angles at one time-frequency point over trials.
+def gray_distribution(counts):
+    """Convert histogram of gray levels to the distribution of normalized pixel values, the same as 'np.unique' of
+    the image divided by 255.0.
 
     Parameters
     ----------
-    k : 1D numpy.ndarray
-        Vector of phase angles at one time-frequency point over trials
-    rayleigh_z : boolean
-        If True transform ITPC to ITPC-Z, also known as Rayleigh's Z. If False compute default ITPC.
+    counts : 1D numpy.ndarray
+        Number of pixels of each gray level (256 bins, see 'gray_histograms').
 
     Returns
     -------
-    itpc : float
-        If rayleigh_z was False return default ITPC value between 0.0 and 1.0.
-        If rayleigh_z was True return ITPC-Z value which is > 0.0.
+    unique_values : 1D numpy.ndarray
+        Normalized (range [0, 1]) gray levels present in the image.
+    percentages : 1D numpy.ndarray
+        Percentage of pixels of each of the gray levels.
     """
-    if rayleigh_z:
-        return len(k) * np.abs(np.mean(np.exp(1j * k))) ** 2
+    counts = np.asarray(counts)
+    if counts.shape == (256,) and counts.sum() > 0:
+        levels = np.flatnonzero(counts)
+        return levels / 255.0, (counts[levels] / counts.sum()) * 100
     else:
-        return np.abs(np.mean(np.exp(1j * k)))
+        raise ValueError("Inappropriate histogram. It should be 1D array of 256 gray level counts.")
 
 
 # VISUALIZATION
@@ -832,10 +3551,14 @@ def superimpose_two_vectors(a, b, shift=0):
     return c
 
 
-def create_signal_template(sf, prefix, postfix, n_trials, trial_base_length, trial_random_length):
+def create_signal_template(sf, prefix, postfix, n_trials, trial_base_length, trial_random_length, sparse=False,
+                           rng=None, return_onsets=False):
     """
     Generate a signal template consisting of pulse-like trials with specified properties.
 
+    Random lengths of all trials are drawn in one call, trial onsets are computed with cumulative sum of the trial
+    lengths and the template is allocated once, with ones scattered at the onsets.
+
     Parameters
     ----------
     sf : int
@@ -850,11 +3573,20 @@ def create_signal_template(sf, prefix, postfix, n_trials, trial_base_length, tri
         Base length of each trial in seconds. Must be > 0.
     trial_random_length : float or None
         Optional random additional length for each trial. Set to None if not needed.
+    sparse : bool
+        If True, return Events with the trial onsets instead of the dense template. Default is False.
+    rng : None, int or numpy.random.Generator
+        Random generator (or seed for numpy.random.default_rng) used for drawing the random trial lengths. If None,
+        global numpy.random state is used (the same lengths as drawn one by one per trial). Default is None.
+    return_onsets : bool
+        If True, return also sample indices of the trial onsets (ignored if sparse is True). Default is False.
 
     Returns
     -------
-    numpy.ndarray
+    numpy.ndarray or Events
         Generated signal template.
+    numpy.ndarray
+        Sample indices (int64) of the trial onsets, returned only if return_onsets is True.
 
     Raises
     ------
@@ -870,44 +3602,42 @@ def create_signal_template(sf, prefix, postfix, n_trials, trial_base_length, tri
         raise ValueError("Error: sf, n_trials, trial_base_length, prefix, postfix, or trial_random_length "
                          "cannot be None or less than or equal to zero. Stopping function.")
 
-    # Initialize list to store signal partial templates
-    signal_template = []
-
-    # Add prefix if specified and greater than zero
-    if prefix is not None and prefix > 0:
-        # Create zeros for the prefix length converted to samples and append to the signal template
-        signal_template.append(np.zeros(int(prefix * sf)))
-
-    # Loop to generate individual trials
-    for _ in range(n_trials):
-        # Calculate the base samples for each trial based on the specified base length
-        trial_base_samples = trial_base_length * sf
-
-        # Add random length if specified and greater than zero
-        if trial_random_length is not None and trial_random_length > 0:
-            # Generate random additional samples within the specified range and adjust trial base samples
-            trial_random_samples = int(np.random.uniform(-trial_random_length * sf, trial_random_length * sf))
-            trial_base_samples += trial_random_samples
-
-        trial = np.zeros(int(trial_base_samples))
-
-        # Set the first sample of each trial to 1 (pulse-like signal)
-        trial[0] = 1
-
-        # Append each trial to the signal template
-        signal_template.append(trial)
-
-    # Add postfix if specified and greater than zero
-    if postfix is not None and postfix > 0:
-        signal_template.append(np.zeros(int(postfix * sf)))
-
-    # Combine all signal indicators into a single template
-    signal_template = np.concatenate(signal_template)
-
+    # Use global random state unless generator or seed is given
+    rng = np.random if rng is None else np.random.default_rng(rng)
+
+    # Lengths of the prefix and postfix converted to samples
+    prefix_samples = int(prefix * sf) if prefix is not None else 0
+    postfix_samples = int(postfix * sf) if postfix is not None else 0
+
+    # Calculate the samples of all trials based on the specified base length and random length
+    trial_samples = np.full(n_trials, trial_base_length * sf)
+    if trial_random_length is not None:
+        # Random additional samples are truncated towards zero, as with int()
+        trial_samples += np.trunc(rng.uniform(-trial_random_length * sf, trial_random_length * sf, n_trials))
+    trial_samples = trial_samples.astype(np.int64)
+    if np.any(trial_samples < 1):
+        raise ValueError("Error: trial_random_length is too long, some trials have no samples. Stopping function.")
+
+    # Trials start after the prefix and after all preceding trials
+    onsets = np.empty(n_trials, dtype=np.int64)
+    onsets[0] = prefix_samples
+    np.cumsum(trial_samples[:-1], out=onsets[1:])
+    onsets[1:] += prefix_samples
+    n_samples = prefix_samples + int(trial_samples.sum()) + postfix_samples
+
+    # Return only the trial onsets if sparse template was requested
+    if sparse:
+        return Events(onsets, n_samples)
+
+    # Set the first sample of each trial to 1 (pulse-like signal)
+    signal_template = np.zeros(n_samples)
+    signal_template[onsets] = 1
+
+    if return_onsets:
+        return signal_template, onsets
     return signal_template
 
 
-
 # def create_sin_pulse(freq, sf, amp, first_peak='positive'):
 #     """
 #     Create one-period sinusoidal pulse.
@@ -1,35 +1,44 @@
-from scipy import signal
+import numpy as np
 import matplotlib.pyplot as plt
+import Utils as ut
 
-# Define the transfer function of the system
-# The system is defined by its numerator and denominator coefficients
-# sys = (numerator, denominator)
-sys = ([1], [1, 2, 1])
+# Parameters of the subthreshold input signal
+fs = 1000  # Sampling frequency in Hz
+t = np.arange(0, 10, 1/fs)  # Time vector from 0 to 10 seconds with step size 1/fs
+f = 10  # Frequency of the sinusoid in Hz
+amplitude = 0.5  # Amplitude of the sinusoid, below the threshold
+threshold = 1  # Threshold of the detector
 
-# Compute the impulse response of the system
-# signal.impulse(sys) computes the impulse response of the linear time-invariant system
-time, y_amp = signal.impulse(sys)
+# Subthreshold sinusoidal input signal
+sinusoid = amplitude * np.sin(2 * np.pi * f * t)
 
-# Normalize the time range to [0, 1]
-time_normalized = time / max(time)  # Scaling time to fit within the range [0, 1]
+# Noise intensities (standard deviations of Gaussian noise) for which mutual information is computed
+noise_levels = np.linspace(0.01, 1, 100)
 
-# Normalize the amplitude range to [0, 1.5]
-y_amp_normalized = y_amp / max(y_amp) * 1.5  # Scaling amplitude to fit within the range [0, 1.5]
+# Noisy signals for all noise levels at once, shape (noise levels x samples)
+rng = np.random.default_rng(0)
+noisy_signals = sinusoid + rng.standard_normal((noise_levels.size, t.size)) * noise_levels[:, np.newaxis]
+
+# Output of the threshold detector, ie. threshold crossings
+output = (noisy_signals > threshold).astype(float)
+
+# Mutual information between the input (positive or negative half-wave) and the output for all noise levels at once
+mutual_information = ut.binned_mutual_information(sinusoid, output, bins=2)
 
 # Create the figure for plotting with a specific size
 plt.figure(figsize=(5, 4))
 
-# Plot the normalized impulse response
-plt.plot(time_normalized, y_amp_normalized, color='black', linewidth=2)
+# Plot the mutual information against the noise intensity
+plt.plot(noise_levels, mutual_information, color='black', linewidth=2)
 
 # Set axis labels and title
 plt.title('Optimal noise level', fontsize=10)
 plt.xlabel("Noise intensity")  # X-axis label
 plt.ylabel("Mutual information (bits)")  # Y-axis label
 
-# Set the limits for the x and y axes according to the specified range
+# Set the limits for the x and y axes
 plt.xlim(0, 1)
-plt.ylim(0, 1.6)
+plt.ylim(0, None)
 
 # Adjust layout for better spacing and presentation
 plt.tight_layout()
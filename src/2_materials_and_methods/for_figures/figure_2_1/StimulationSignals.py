@@ -1,35 +1,6 @@
 import numpy as np
 import matplotlib.pyplot as plt
-
-# Function to generate FFT-based band-limited noise
-def fftnoise(f):
-    f = np.array(f, dtype='complex')
-    Np = (len(f) - 1) // 2
-    phases = np.random.rand(Np) * 2 * np.pi
-    phases = np.cos(phases) + 1j * np.sin(phases)
-    f[1:Np+1] *= phases
-    f[-1:-1-Np:-1] = np.conj(f[1:Np+1])
-    return np.fft.ifft(f).real
-
-# Function to generate band-limited noise between min_freq and max_freq
-def band_limited_noise(min_freq, max_freq, samples, samplerate):
-    freqs = np.abs(np.fft.fftfreq(samples, 1/samplerate))
-    f = np.zeros(samples)
-    idx = np.where(np.logical_and(freqs >= min_freq, freqs <= max_freq))[0]
-    f[idx] = 1
-    return fftnoise(f)
-
-
-# Function to generate band-limited Gaussian noise
-def band_limited_gaussian_noise(min_freq, max_freq, samples, samplerate):
-    freqs = np.abs(np.fft.fftfreq(samples, 1 / samplerate))
-    f = np.zeros(samples, dtype='complex')  # FFT of the noise will be complex-valued
-    idx = np.where(np.logical_and(freqs >= min_freq, freqs <= max_freq))[0]
-
-    # Create a Gaussian-distributed random noise spectrum within the frequency range
-    f[idx] = np.random.randn(len(idx)) + 1j * np.random.randn(
-        len(idx))  # Gaussian-distributed complex noise
-    return fftnoise(f)
+import Utils as ut
 
 # Parameters for the band-limited noise (for the third plot)
 min_freq = 100  # Minimum frequency in Hz
@@ -42,7 +13,7 @@ amplitude = 100  # Maximum amplitude in microamperes (µA)
 samples = int(samplerate * duration)
 
 # Generate band-limited noise
-noise_signal = band_limited_gaussian_noise(min_freq, max_freq, samples, samplerate)
+noise_signal = ut.band_limited_noise(min_freq, max_freq, samples, samplerate, kind='gaussian')
 
 # Normalize the signal to the desired amplitude (100 µA)
 noise_signal = noise_signal / np.max(np.abs(noise_signal)) * amplitude
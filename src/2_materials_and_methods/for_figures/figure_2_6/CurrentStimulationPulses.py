@@ -21,13 +21,16 @@ params = [
 # Generate a timescale for plotting (100 points, 1000 Hz sampling rate, time unit in milliseconds)
 timescale = ut.create_time_scale(100, 1000, 'ms')
 
+# Bank of the pulses, so that each pulse shape is computed only once
+bank = ut.PulseBank()
+
 # Create a figure with 1 row and 9 columns, sharing the Y-axis across all subplots
 fig, axs = plt.subplots(1, 9, figsize=(10, 1.75), sharey=True)  # 1 row, 9 columns
 
 # Iterate over each subplot and parameter set (duration, amplitude)
 for i, (ax, (duration, amplitude)) in enumerate(zip(axs, params)):
     # Generate a sinusoidal pulse based on the given duration and amplitude
-    pulse, _ = ut.create_sin_pulse(1000 / duration, 1000, amplitude)
+    pulse = bank.get(1000 / duration, 1000, amplitude)
 
     # Pad the pulse with zeros to make its length equal to 100
     pulse = np.pad(pulse, (0, 100 - len(pulse)), 'constant', constant_values=0)
@@ -24,12 +24,15 @@ params = [
 # Create a time scale using utility function (assumed 100 samples, 1000 Hz sampling rate)
 timescale = ut.create_time_scale(100, 1000, 'ms')
 
+# Bank of the pulses, so that each pulse shape is computed only once
+bank = ut.PulseBank()
+
 # Create subplots with shared X and Y axes
 fig, axs = plt.subplots(3, 4, figsize=(7, 5), sharey=True, sharex=True)  # 3 rows, 4 columns
 
 for i, (ax, (duration, amplitude)) in enumerate(zip(axs.flat, params)):
     if i < 9:  # Only fill the first 9 subplots with data
-        pulse, _ = ut.create_sin_pulse(1000.0 / duration, 1000, float(amplitude))  # Generate sinusoidal pulse
+        pulse = bank.get(1000.0 / duration, 1000, float(amplitude))  # Get sinusoidal pulse from the bank
 
         # Pad pulse with zeros to make its length equal to 100
         pulse = np.pad(pulse, (0, 100 - len(pulse)), 'constant', constant_values=0)
@@ -1,29 +1,20 @@
-import nibabel as nib
-import numpy as np
+import pandas as pd
+import Utils as ut
 
-field_type = 'magnE'  # Replace with 'magnE' or 'magnJ'
-configuration = 'periorbital'  # Replace with 'periorbital' or 'frontal_occipital'
+field_types = ['magnE', 'magnJ']
+configurations = ['periorbital', 'frontal_occipital']
 
-# Load the NIfTI files
-magnE_img = nib.load(f"../../data/ief/{configuration}_conf_{field_type}.nii.gz")
-rois_img = nib.load("../../data/ief/rois.nii.gz")
-
-# Get data arrays
-magnE_data = magnE_img.get_fdata()
-rois_data = rois_img.get_fdata()
-rois_data = np.squeeze(rois_data, axis=-1)  # Remove the last dimension
+# Load the NIfTI files as memory-mapped data arrays
+store = ut.VolumeStore()
+rois_data = store.load("../../data/ief/rois.nii.gz")
+names = [f"{configuration}_conf_{field_type}" for configuration in configurations for field_type in field_types]
+volumes = [store.load(f"../../data/ief/{name}.nii.gz") for name in names]
 
 print(rois_data.shape)
 
-# Get unique ROI labels (excluding background 0)
-roi_labels = np.unique(rois_data)
-roi_labels = roi_labels[roi_labels > 0]  # Exclude background
-
-# Calculate mean magnitude electric field values for each ROI
-roi_means = {}
-for roi in roi_labels:
-    roi_mask = rois_data == roi
-    roi_means[roi] = np.mean(magnE_data[roi_mask])
+# Calculate statistics of the field values for each ROI in all volumes at once
+stats = ut.roi_statistics(rois_data, volumes, names=names)
+stats = stats[stats['label'] > 0]  # Exclude background
 
 # Define ROI labels
 roi_labels_dict = {
@@ -32,8 +23,8 @@ roi_labels_dict = {
     2: "Optic Nerves",
     4: "Rest of the Brain"
 }
+stats.insert(2, 'roi', stats['label'].map(roi_labels_dict).fillna("Unknown ROI"))
 
-# Print the results with ROI labels
-for roi, mean_value in roi_means.items():
-    roi_label = roi_labels_dict.get(int(roi), "Unknown ROI")  # Get label, default to "Unknown ROI" if not found
-    print(f"ROI {int(roi)} ({roi_label}): Mean Magnitude Electric Field = {mean_value:.6f} mV/mm")
+# Print the results with ROI labels (mV/mm for magnE)
+pd.set_option('display.width', 120)
+print(stats.round({'mean': 6, 'sd': 6, 'min': 6, 'max': 6}).to_string(index=False))
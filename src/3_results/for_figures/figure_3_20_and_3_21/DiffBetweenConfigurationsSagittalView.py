@@ -1,51 +1,50 @@
-import nibabel as nib
 import matplotlib.pyplot as plt
 from matplotlib.colors import LinearSegmentedColormap
 import numpy as np
+import Utils as ut
+
+store = ut.VolumeStore()  # Decompressed, memory-mapped NIfTI volumes
 
 field_type = 'magnE'  # Replace with 'magnE' or 'magnJ'
 
 # Load the first NIfTI file (T1)
 file_path_1 = '../../data/ief/T1.nii.gz'  # Replace with your file path
-img1 = nib.load(file_path_1)
-data1 = img1.get_fdata()
+data1 = store.load(file_path_1)
 
 # Get the center index in the X (sagittal) dimension for the first data
 center_x1 = data1.shape[0] // 2
-sagittal_slice1 = np.mean(data1[75:76, :, :], axis=0)  # np.mean(data1[110:111, :, :], axis=0) # data1[center_x1, :, :]  # Extract the sagittal slice at the center
+sagittal_slice1 = np.asarray(data1[75], dtype=np.float64)  # data1[110] # data1[center_x1, :, :]  # Extract the sagittal slice at the center
 
 print(f"Center slice: {center_x1}")
 
 # Load the second NIfTI file (stacked data)
 file_path_2 = f'../../data/ief/periorbital_conf_{field_type}.nii.gz'  # Replace with your file path
-img2 = nib.load(file_path_2)
-data2 = img2.get_fdata()
+projections2 = ut.SlabProjections(file_path_2, axis=0, store=store)
 
-print(f"Shape of second data: {data2.shape}")
+print(f"Shape of second data: {projections2.shape}")
 
 # Get the center index and range for stacking slices in the second data
-center_x2 = data2.shape[0] // 2
+center_x2 = projections2.shape[0] // 2
 slice_range = 30  # Number of slices to include on each side of the center
 start_idx = 44  # 109 # max(center_x2 - slice_range, 0)
-end_idx = 75  # 135 # min(center_x2 + slice_range, data2.shape[0])
-stacked_slices_facial = np.mean(data2[start_idx:end_idx, :, :], axis=0)  # Averaging for stacking
+end_idx = 75  # 135 # min(center_x2 + slice_range, projections2.shape[0])
+stacked_slices_facial = projections2.mean(start_idx, end_idx)  # Averaging for stacking
 
 # Mask zero values in the stacked slices
 stacked_slices_facial[stacked_slices_facial == 0] = np.nan  # Set zero values to NaN for transparency
 
 # Load the second NIfTI file (stacked data)
 file_path_3 = f'../../data/ief/frontal_occipital_conf_{field_type}.nii.gz'  # Replace with your file path
-img3 = nib.load(file_path_3)
-data3 = img3.get_fdata()
+projections3 = ut.SlabProjections(file_path_3, axis=0, store=store)
 
-print(f"Shape of third data: {data3.shape}")
+print(f"Shape of third data: {projections3.shape}")
 
 # Get the center index and range for stacking slices in the second data
-center_x3 = data3.shape[0] // 2
+center_x3 = projections3.shape[0] // 2
 slice_range = 30  # Number of slices to include on each side of the center
 start_idx = 44  # 109 # max(center_x2 - slice_range, 0)
-end_idx = 75  # 135 # min(center_x2 + slice_range, data2.shape[0])
-stacked_slices_occipital = np.mean(data3[start_idx:end_idx, :, :], axis=0)  # Averaging for stacking
+end_idx = 75  # 135 # min(center_x2 + slice_range, projections2.shape[0])
+stacked_slices_occipital = projections3.mean(start_idx, end_idx)  # Averaging for stacking
 
 # Mask zero values in the stacked slices
 stacked_slices_occipital[stacked_slices_occipital == 0] = np.nan  # Set zero values to NaN for transparency
@@ -1,6 +1,7 @@
 import mne
 import matplotlib.pyplot as plt
 import numpy as np
+import Utils as ut
 
 epochs = mne.read_epochs('../../data/ledes/all-cleaned-occipital-epo.fif')
 
@@ -48,13 +49,8 @@ times = np.linspace(-0.5, 1.0, len(gfp))  # From -0.5 to 1.0 seconds
 baseline_start = -0.2
 baseline_end = 0.0
 
-# Indeksy odpowiadające przedziałowi bazowemu
-baseline_indices = (times >= baseline_start) & (times < baseline_end)
-
-# Oblicz średnią w oknie bazowym (dla każdego kanału i epoki, jeśli dane mają więcej wymiarów)
-baseline_mean = np.mean(gfp[baseline_indices])
-
-gfp = gfp - baseline_mean
+# Korekcja linii bazowej (średnia w oknie bazowym odjęta od GFP)
+gfp = ut.baseline_correct_epochs(gfp, times, (baseline_start, baseline_end))
 
 # Step 3: Plotting GFP with shaded area under the curve
 plt.rcParams.update({'font.size': 11})
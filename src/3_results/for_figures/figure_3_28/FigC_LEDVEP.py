@@ -1,6 +1,7 @@
 import mne
 import matplotlib.pyplot as plt
 import numpy as np
+import Utils as ut
 from scipy.stats import sem
 
 # Load preprocessed EEG epochs
@@ -24,12 +25,8 @@ time_vector = np.linspace(-0.5, 1.0, len(vector))
 baseline_start = -0.2
 baseline_end = 0.0
 
-# Identify indices corresponding to the baseline window
-baseline_indices = (time_vector >= baseline_start) & (time_vector < baseline_end)
-
 # Compute the baseline mean and subtract it from the data
-baseline_mean = np.mean(vector[baseline_indices])
-vector = vector - baseline_mean  # Baseline correction
+vector = ut.baseline_correct_epochs(vector, time_vector, (baseline_start, baseline_end))  # Baseline correction
 
 # Configure plot settings
 plt.rcParams.update({'font.size': 11})
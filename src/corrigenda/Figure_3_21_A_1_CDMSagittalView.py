@@ -1,15 +1,17 @@
-import nibabel as nib
 import matplotlib.pyplot as plt
 import numpy as np
+import Utils as ut
+
+store = ut.VolumeStore()  # Decompressed, memory-mapped NIfTI volumes
 
 # Load the first NIfTI file (T1)
 file_path_1 = 'data/ief/T1.nii.gz'  # Replace with your file path
-img1 = nib.load(file_path_1)
-data1 = img1.get_fdata()
+img1 = store.image(file_path_1)
+data1 = store.load(file_path_1)
 
 # Get the center index in the X (sagittal) dimension for the first data
 center_x1 = data1.shape[0] // 2
-sagittal_slice1 = np.mean(data1[75:76], axis=0)  # Extract the sagittal slice at the center
+sagittal_slice1 = np.asarray(data1[75], dtype=np.float64)  # Extract the sagittal slice at the center
 
 # Voxel index for the slice (x-coordinate in voxel space)
 voxel_index = np.array([75, 0, 0, 1])  # [x, y, z, 1] in homogeneous coordinates
@@ -26,17 +28,16 @@ print(f"Center slice: {center_x1}")
 
 # Load the second NIfTI file (stacked data)
 file_path_2 = 'data/ief/periorbital/cec_gm_wm_eb_magnJ.nii.gz'  # Replace with your file path
-img2 = nib.load(file_path_2)
-data2 = img2.get_fdata()
+projections2 = ut.SlabProjections(file_path_2, axis=0, store=store)
 
-print(f"Shape of second data: {data2.shape}")
+print(f"Shape of second data: {projections2.shape}")
 
 # Get the center index and range for stacking slices in the second data
-center_x2 = data2.shape[0] // 2
+center_x2 = projections2.shape[0] // 2
 slice_range = 30  # Number of slices to include on each side of the center
 start_idx = 44
 end_idx = 75
-stacked_slices = np.mean(data2[start_idx:end_idx, :, :], axis=0)  # Averaging for stacking
+stacked_slices = projections2.mean(start_idx, end_idx)  # Averaging for stacking
 
 # Mask zero values in the stacked slices
 stacked_slices[stacked_slices == 0] = np.nan  # Set zero values to NaN for transparency
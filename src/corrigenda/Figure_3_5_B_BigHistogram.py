@@ -10,26 +10,15 @@ Elliptical (no 3 cm²) (front):    1.89053
 New maximum (elliptical 3 cm²):    1.76803
 """
 
-from PIL import Image
-import numpy as np
+import Utils as ut
 import matplotlib.pyplot as plt
 
-def get_distribution(image_path):
-    # Load the image and convert to grayscale
-    image = Image.open(image_path).convert('L')
-    # Convert image to a NumPy array and normalize values to range [0, 1]
-    image_array = np.array(image) / 255.0
-    # Calculate the distribution of values
-    unique_values, counts = np.unique(image_array, return_counts=True)
-    # Calculate percentages
-    percentages = (counts / counts.sum()) * 100
-    return unique_values, percentages
-
 # Load and calculate distributions for two images
 image_path1 = 'data/ief/electrodes/cropped_periorbital_eliptical_3cm2.png'
 image_path2 = 'data/ief/electrodes/cropped_periorbital_rectangular_3cm2.png'
-unique_values1, percentages1 = get_distribution(image_path1)
-unique_values2, percentages2 = get_distribution(image_path2)
+counts1, counts2 = ut.gray_histograms([image_path1, image_path2])  # Cached 256-bin histograms
+unique_values1, percentages1 = ut.gray_distribution(counts1)
+unique_values2, percentages2 = ut.gray_distribution(counts2)
 
 # Plot the distributions of pixel values for both images
 plt.figure(figsize=(5, 3)) # plt.figure(figsize=(5, 3))
@@ -1,46 +1,26 @@
-from PIL import Image
-import numpy as np
 import matplotlib.pyplot as plt
-import pandas as pd
-from scipy.stats import ks_2samp
-import seaborn as sns
-
-def get_values(image_path):
-    # Load the image and convert to grayscale
-    image = Image.open(image_path).convert('L')
-    # Convert image to a NumPy array and normalize values to range [0, 1]
-    image_array = np.array(image) / 255.0
-    return image_array.flatten()
+import Utils as ut
 
 # Load and calculate distributions for two images
 image_path1 = 'data/ief/electrodes/cropped_periorbital_eliptical_no3cm2.png'
 image_path2 = 'data/ief/electrodes/cropped_periorbital_rectangular_3cm2.png'
 
-values_cond1 = get_values(image_path1)
-values_cond2 = get_values(image_path2)
-
-# Downsample the data
-values_cond1 = values_cond1[::10000]
-values_cond2 = values_cond2[::10000]
+# Gray levels of the images (uint8)
+image1, image2 = ut.load_gray_images([image_path1, image_path2])
+values_cond1 = image1.ravel()
+values_cond2 = image2.ravel()
 
-# Find the total minimum and maximum across both datasets
-total_min = min(values_cond1.min(), values_cond2.min())
-total_max = max(values_cond1.max(), values_cond2.max())
+# Downsample the data and normalize values to range [0, 1]
+values_cond1 = values_cond1[::10000] / 255.0
+values_cond2 = values_cond2[::10000] / 255.0
 
-# Normalize the values using the global minimum and maximum
-values_cond1 = (values_cond1 - total_min) / (total_max - total_min)
-values_cond2 = (values_cond2 - total_min) / (total_max - total_min)
+# Normalize the values using the global minimum and maximum across both datasets
+values_cond1, values_cond2 = ut.shared_rescale([values_cond1, values_cond2])
 
 # # Choosse values only between 0.6 and 1.0
 # values_cond1 = values_cond1[(values_cond1 >= 0.5) & (values_cond1 <= 1.0)]
 # values_cond2 = values_cond2[(values_cond2 >= 0.5) & (values_cond2 <= 1.0)]
 
-weights1 = np.ones_like(values_cond1) / len(values_cond1)
-weights2 = np.ones_like(values_cond2) / len(values_cond2)
-
-df1 = pd.DataFrame({'data': values_cond1, 'weights': weights1})
-df2 = pd.DataFrame({'data': values_cond2, 'weights': weights2})
-
 """
 Kolmogorov-Smirnov (KS) Test
 Purpose: Compares the entire distribution functions of two datasets.
@@ -48,15 +28,15 @@ When to Use: If you want to assess whether the two distributions are significant
 Limitations: More sensitive to differences in the central part of the distribution than at the tails.
 """
 
-stat, p_value = ks_2samp(values_cond1, values_cond2)
+stat, p_value = ut.ks_two_sample(values_cond1, values_cond2)
 print(f"KS Test Statistic: {stat:.3f}, p-value: {p_value:.3f}")
 
 # Compact and aesthetically pleasing visualization
 colors = ['red', 'blue']
 plt.figure(figsize=(5, 3), dpi=150)  # Small, high-resolution figure
 
-sns.kdeplot(data=df2, x='data', color=colors[1], alpha=0.75, label='Rectangle', linewidth=2, cumulative=True, weights='weights')
-sns.kdeplot(data=df1, x='data', color=colors[0], alpha=0.75, label='Elipsoid', linewidth=2, cumulative=True, weights='weights')
+plt.step(*ut.ecdf(values_cond2), where='post', color=colors[1], alpha=0.75, label='Rectangle', linewidth=2)
+plt.step(*ut.ecdf(values_cond1), where='post', color=colors[0], alpha=0.75, label='Elipsoid', linewidth=2)
 
 plt.title(f'Electrodes with Different Surfaces', pad=20)
 plt.ylabel('Cumulative Density')
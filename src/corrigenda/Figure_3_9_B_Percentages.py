@@ -1,16 +1,4 @@
-from PIL import Image
-import numpy as np
-
-def get_distribution(image_path):
-    # Load the image and convert to grayscale
-    image = Image.open(image_path).convert('L')
-    # Convert image to a NumPy array and normalize values to range [0, 1]
-    image_array = np.array(image) / 255.0
-    # Calculate the distribution of values
-    unique_values, counts = np.unique(image_array, return_counts=True)
-    # Calculate percentages
-    percentages = (counts / counts.sum()) * 100
-    return unique_values, percentages
+import Utils as ut
 
 def get_percentage_in_range(unique_values, percentages, min_val=0.5, max_val=1.0):
     # Filter the values in the specified range
@@ -21,8 +9,9 @@ def get_percentage_in_range(unique_values, percentages, min_val=0.5, max_val=1.0
 # Load and calculate distributions for two images
 image_path1 = 'data/ief/electrodes/cropped_front_occip_ellipitcal_35cm2_rear_blacknwhite.png'
 image_path2 = 'data/ief/electrodes/cropped_front_occip_rectangular_35cm2_rear_blacknwhite.png'
-unique_values1, percentages1 = get_distribution(image_path1)
-unique_values2, percentages2 = get_distribution(image_path2)
+counts1, counts2 = ut.gray_histograms([image_path1, image_path2])  # Cached 256-bin histograms
+unique_values1, percentages1 = ut.gray_distribution(counts1)
+unique_values2, percentages2 = ut.gray_distribution(counts2)
 
 # Calculate percentages for values between 0.6 and 1.0 for each image
 percentage_in_range1 = get_percentage_in_range(unique_values1, percentages1)
@@ -1,23 +1,17 @@
-from PIL import Image
-import numpy as np
+import Utils as ut
 
 
-def get_values(image_path):
-    # Load the image and convert to grayscale
-    image = Image.open(image_path).convert('L')
-    # Convert image to a NumPy array and normalize values to range [0, 1]
-    image_array = np.array(image) / 255.0
-    return image_array.flatten()
-
 image_path1 = 'data/ief/electrodes/cropped_front_occip_elliptical_35cm2_rear_blacknwhite_recmax.png'
 image_path2 = 'data/ief/electrodes/cropped_front_occip_rectangular_35cm2_rear_blacknwhite_recmax.png'
 
-values_cond1 = get_values(image_path1)
-values_cond2 = get_values(image_path2)
+# Gray levels of the images (uint8)
+image1, image2 = ut.load_gray_images([image_path1, image_path2])
+values_cond1 = image1.ravel()
+values_cond2 = image2.ravel()
 
-# Downsample the data
-values_cond1 = values_cond1[::100]
-values_cond2 = values_cond2[::100]
+# Downsample the data and normalize values to range [0, 1]
+values_cond1 = values_cond1[::100] / 255.0
+values_cond2 = values_cond2[::100] / 255.0
 
 current_max = 1.0
 new_max_e = 1.57148